@@ -1,12 +1,27 @@
 from config.connections import (
-        get_mssql_connection,
+    ConnectionProfile,
+    MSSQL_PROFILES,
+    get_mssql_connection,
     get_postgres_connection,
+    mssql_profile,
+)
+from config.type_mapping import (
+    POLARS_TO_PG,
+    PG_TO_POLARS,
+    pg_type_from_polars,
+    polars_type_from_pg,
+    polars_schema_from_columns,
 )
-from config.type_mapping import POLARS_TO_PG, pg_type_from_polars
 
 __all__ = [
+    "ConnectionProfile",
+    "MSSQL_PROFILES",
     "get_mssql_connection",
     "get_postgres_connection",
+    "mssql_profile",
     "POLARS_TO_PG",
+    "PG_TO_POLARS",
     "pg_type_from_polars",
+    "polars_type_from_pg",
+    "polars_schema_from_columns",
 ]
@@ -1,19 +1,86 @@
+import os
+from dataclasses import dataclass
+
 import pyodbc
 import psycopg
 from roskarl import DSN
 
+SQL_ATTR_PACKET_SIZE = 112
+
+ISOLATION_LEVELS = {
+    "READ UNCOMMITTED",
+    "READ COMMITTED",
+    "REPEATABLE READ",
+    "SNAPSHOT",
+    "SERIALIZABLE",
+}
+
+
+@dataclass(frozen=True)
+class ConnectionProfile:
+    driver: str = "ODBC Driver 18 for SQL Server"
+    trust_server_certificate: bool = True
+    application_intent: str | None = None
+    isolation_level: str | None = None
+    packet_size: int | None = None
+    # A down server should be noticed in seconds; a big extract may run long
+    login_timeout: int = 30
+    query_timeout: int = 3600
+
+
+# Selected per source with <ENV_VAR_NAME>_PROFILE, e.g.
+# RAINDANCE_2610_PROFILE=replica. Sources without one get "default".
+MSSQL_PROFILES: dict[str, ConnectionProfile] = {
+    "default": ConnectionProfile(),
+    # Routed to a readable secondary of an availability group listener
+    "replica": ConnectionProfile(
+        application_intent="ReadOnly",
+        isolation_level="SNAPSHOT",
+        packet_size=32767,
+    ),
+    # Row versioning on the primary; needs ALLOW_SNAPSHOT_ISOLATION ON
+    "snapshot": ConnectionProfile(isolation_level="SNAPSHOT", packet_size=32767),
+    # No shared locks at all, at the price of dirty reads
+    "nolock": ConnectionProfile(isolation_level="READ UNCOMMITTED", packet_size=32767),
+}
 
-def get_mssql_connection(dsn: DSN, timeout: int = 600) -> pyodbc.Connection:
+
+def mssql_profile(env_var_name: str) -> ConnectionProfile:
+    name = os.environ.get(f"{env_var_name}_PROFILE", "default")
+    try:
+        return MSSQL_PROFILES[name.lower()]
+    except KeyError:
+        raise ValueError(
+            f"{env_var_name}_PROFILE: unknown connection profile {name!r}, "
+            f"expected one of {sorted(MSSQL_PROFILES)}"
+        ) from None
+
+
+def get_mssql_connection(dsn: DSN, profile: ConnectionProfile = MSSQL_PROFILES["default"]) -> pyodbc.Connection:
     conn_string = (
-        f"DRIVER={{ODBC Driver 18 for SQL Server}};"
+        f"DRIVER={{{profile.driver}}};"
         f"SERVER={dsn.hostname},{dsn.port};"
         f"DATABASE={dsn.database};"
         f"UID={dsn.username};"
         f"PWD={dsn.password};"
-        f"TrustServerCertificate=yes"
+        f"TrustServerCertificate={'yes' if profile.trust_server_certificate else 'no'}"
     )
-    conn = pyodbc.connect(conn_string, timeout=timeout)
-    conn.timeout = timeout
+    if profile.application_intent:
+        conn_string += f";ApplicationIntent={profile.application_intent}"
+
+    attrs_before = {}
+    if profile.packet_size:
+        attrs_before[SQL_ATTR_PACKET_SIZE] = profile.packet_size
+
+    conn = pyodbc.connect(conn_string, timeout=profile.login_timeout, attrs_before=attrs_before or None)
+    conn.timeout = profile.query_timeout
+
+    if profile.isolation_level:
+        level = profile.isolation_level.upper()
+        if level not in ISOLATION_LEVELS:
+            conn.close()
+            raise ValueError(f"Unknown isolation level {profile.isolation_level!r}")
+        conn.execute(f"SET TRANSACTION ISOLATION LEVEL {level}")
     return conn
 
 
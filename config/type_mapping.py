@@ -17,6 +17,54 @@ POLARS_TO_PG: dict[type, str] = {
     pl.Binary: "BYTEA",
 }
 
+# Source timestamps arrive naive from ODBC, so both TIMESTAMP and TIMESTAMPTZ
+# stay naive here and Postgres applies the session time zone as before.
+PG_TO_POLARS: dict[str, pl.DataType] = {
+    "SMALLINT": pl.Int16(),
+    "INT2": pl.Int16(),
+    "INTEGER": pl.Int32(),
+    "INT4": pl.Int32(),
+    "BIGINT": pl.Int64(),
+    "INT8": pl.Int64(),
+    "REAL": pl.Float32(),
+    "FLOAT4": pl.Float32(),
+    "DOUBLE PRECISION": pl.Float64(),
+    "FLOAT8": pl.Float64(),
+    "NUMERIC": pl.Float64(),
+    "DECIMAL": pl.Float64(),
+    "CHAR": pl.String(),
+    "VARCHAR": pl.String(),
+    "CHARACTER VARYING": pl.String(),
+    "TEXT": pl.String(),
+    "UUID": pl.String(),
+    "JSON": pl.String(),
+    "JSONB": pl.String(),
+    "BOOLEAN": pl.Boolean(),
+    "DATE": pl.Date(),
+    "TIMESTAMP": pl.Datetime("us"),
+    "TIMESTAMPTZ": pl.Datetime("us"),
+    "TIME": pl.Time(),
+    "BYTEA": pl.Binary(),
+}
+
 
 def pg_type_from_polars(dtype: pl.DataType) -> str:
     return POLARS_TO_PG.get(type(dtype), "TEXT")
+
+
+def polars_type_from_pg(column) -> pl.DataType | None:
+    type_name = column.data_type.value
+    # Unscaled NUMERIC has no fixed scale to pin a Decimal to, so it goes
+    # through Float64; declared precision/scale keeps exact decimals.
+    if type_name in ("NUMERIC", "DECIMAL") and column.scale is not None:
+        return pl.Decimal(column.precision, column.scale)
+    return PG_TO_POLARS.get(type_name)
+
+
+def polars_schema_from_columns(columns: list) -> dict[str, pl.DataType]:
+    schema = {}
+    for col in columns:
+        dtype = polars_type_from_pg(col)
+        if dtype is not None:
+            schema[col.name] = dtype
+    return schema
@@ -1,9 +1,14 @@
-from .read import read
+from .read import read, read_changes, read_keyset
 from .write import write
-from .run import run
+from .run import run, window
+from .modes import LoadMode
 
 __all__ = [
     "read",
+    "read_keyset",
+    "read_changes",
     "write",
     "run",
+    "window",
+    "LoadMode",
 ]
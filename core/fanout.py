@@ -0,0 +1,219 @@
+from __future__ import annotations
+import copy
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING
+
+import polars as pl
+from roskarl import env_var_dsn
+
+if TYPE_CHECKING:
+    from bollhav import Model
+    from roskarl import DSN
+
+# Models are also written to every destination named in FANOUT_ENVS (env vars
+# holding a DSN), next to the one they pass to run(). The source is read once:
+# its frames are spooled to local disk while one writer per destination loads
+# them concurrently. A writer that fails retries from the spool on its own,
+# without going back to the source or holding up the other destinations.
+# Keyed models start extracting once every writer knows where it resumes;
+# destinations at the same checkpoint share one extract.
+FANOUT_ENVS = [name.strip() for name in os.environ.get("FANOUT_ENVS", "").split(",") if name.strip()]
+FANOUT_RETRIES = int(os.environ.get("FANOUT_RETRIES", "2"))
+FANOUT_RETRY_DELAY = int(os.environ.get("FANOUT_RETRY_DELAY", "30"))
+
+
+def destination(dest_dsn: DSN) -> str:
+    return f"{dest_dsn.hostname}/{dest_dsn.database}"
+
+
+def destinations(dest_dsn: DSN | list[DSN] | None) -> list[DSN | None]:
+    dsns = list(dest_dsn) if isinstance(dest_dsn, (list, tuple)) else [dest_dsn]
+    dsns = [dsn for dsn in dsns if dsn] + [env_var_dsn(name) for name in FANOUT_ENVS]
+    unique = {}
+    for dsn in dsns:
+        unique.setdefault(destination(dsn), dsn)
+    return list(unique.values()) or [None]
+
+
+class SourceFailed(Exception):
+    pass
+
+
+class Spool:
+    def __init__(self):
+        self.path = tempfile.mkdtemp(prefix="sidewinder-spool-")
+        self.frames = 0
+        self.done = False
+        self.error: BaseException | None = None
+        self._cond = threading.Condition()
+
+    def _file(self, index: int) -> str:
+        return os.path.join(self.path, f"{index:06d}.arrow")
+
+    def fill(self, frames) -> None:
+        try:
+            for df in frames:
+                df.write_ipc(self._file(self.frames))
+                with self._cond:
+                    self.frames += 1
+                    self._cond.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def __iter__(self):
+        return self.replay()
+
+    def replay(self, key: list[str] | None = None, after: str | None = None):
+        # A retried writer resumes after the frame its checkpoint was taken
+        # from, which this spool delivered
+        index = 0
+        skipping = after is not None
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.frames > index or self.done)
+                if self.frames <= index:
+                    if self.error is not None:
+                        raise SourceFailed(str(self.error))
+                    if skipping:
+                        raise RuntimeError(f"checkpoint {after} was not delivered by this extract")
+                    return
+            df = pl.read_ipc(self._file(index))
+            index += 1
+            if skipping:
+                skipping = json.dumps(list(df.select(key).row(-1)), default=str) != after
+                continue
+            yield df
+
+    def close(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class Feed:
+    def __init__(self, fn, env, cfg: Model, writers: int, keyed: bool, submit):
+        self.fn, self.env, self.cfg = fn, env, cfg
+        self.keyed = keyed
+        self.pending = writers
+        self.positions: dict[str, Spool | None] = {}
+        self.started = False
+        self._submit = submit
+        self._cond = threading.Condition()
+
+    def _extract(self, after):
+        yield from self.fn(self.env, self.cfg, after=after) if self.keyed else self.fn(self.env, self.cfg)
+
+    def _leave(self) -> None:
+        self.pending -= 1
+        if self.pending == 0:
+            for position in self.positions:
+                spool = self.positions[position] = Spool()
+                self._submit(spool.fill, self._extract(json.loads(position)))
+            self.started = True
+            self._cond.notify_all()
+
+    def join(self, after: list | None) -> tuple[Spool, str]:
+        position = json.dumps(after, default=str)
+        with self._cond:
+            self.positions[position] = None
+            self._leave()
+            self._cond.wait_for(lambda: self.started)
+            return self.positions[position], position
+
+    def withdraw(self) -> None:
+        with self._cond:
+            self._leave()
+
+    def spools(self) -> list[Spool]:
+        return [spool for spool in self.positions.values() if spool is not None]
+
+
+def _raise_failed(cfg: Model, failed: dict[str, Exception], total: int) -> None:
+    if failed:
+        details = "; ".join(f"{label}: {e}" for label, e in failed.items())
+        raise RuntimeError(f"{len(failed)} of {total} destinations failed for {cfg.name}: {details}")
+
+
+def _with_retries(target: Model, load) -> None:
+    from core.read import SourceUnavailable
+
+    # A retried APPEND would write the batches committed before the failure
+    # a second time
+    retries = 0 if target.write_mode.value == "APPEND" else FANOUT_RETRIES
+    for attempt in range(1, retries + 2):
+        try:
+            load()
+            return
+        except (SourceFailed, SourceUnavailable):
+            raise
+        except Exception as e:
+            if attempt > retries:
+                raise
+            print(f"  ↻ {target.name}: attempt {attempt} failed, retrying in {FANOUT_RETRY_DELAY}s: {e}")
+            time.sleep(FANOUT_RETRY_DELAY)
+
+
+def fan_out(cfg: Model, fn, env, dsns: list[DSN], load, key: list[str] | None = None) -> None:
+    executor = ThreadPoolExecutor(max_workers=2 * len(dsns), thread_name_prefix="fanout")
+    feed = Feed(fn, env, cfg, len(dsns), bool(key), executor.submit)
+
+    def write_to(dsn: DSN) -> None:
+        # Each writer flips write_mode and schema on its own copy
+        target = copy.copy(cfg)
+        target.name = f"{cfg.name} @ {destination(dsn)}"
+        joined = []
+
+        def replay(env, cfg, after=None):
+            if not joined:
+                joined.append(feed.join(after))
+            spool, start = joined[0]
+            position = json.dumps(after, default=str)
+            return spool.replay(key, None if position == start else position)
+
+        try:
+            _with_retries(target, lambda: load(target, replay, env, dsn))
+        finally:
+            if not joined:
+                feed.withdraw()
+
+    try:
+        with executor:
+            futures = {destination(dsn): executor.submit(write_to, dsn) for dsn in dsns}
+            # Extracts are submitted by the writers, so keep accepting them
+            wait(futures.values())
+    finally:
+        for spool in feed.spools():
+            spool.close()
+
+    # A source failure is the model's failure, not any destination's
+    for spool in feed.spools():
+        if spool.error is not None:
+            raise spool.error
+    failed = {label: future.exception() for label, future in futures.items() if future.exception()}
+    _raise_failed(cfg, failed, len(dsns))
+
+
+def load_each(cfg: Model, dsns: list[DSN], load) -> None:
+    # A Change Tracking feed is read from each destination's own version
+    from core.read import SourceUnavailable
+
+    failed = {}
+    for dsn in dsns:
+        target = copy.copy(cfg)
+        target.name = f"{cfg.name} @ {destination(dsn)}"
+        try:
+            _with_retries(target, lambda: load(target, dsn))
+        except SourceUnavailable:
+            raise
+        except Exception as e:
+            print(f"✗ {target.name} failed: {e}")
+            failed[destination(dsn)] = e
+    _raise_failed(cfg, failed, len(dsns))
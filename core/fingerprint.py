@@ -0,0 +1,29 @@
+import hashlib
+
+import polars as pl
+from core.metadata import METADATA_COLUMNS
+
+MASK_64 = (1 << 64) - 1
+
+
+class ContentHash:
+    # Order-independent fingerprint of everything a model extracted: row
+    # hashes from two seeds are summed (wrapping at 64 bits) batch by batch,
+    # so neither source row order nor batch boundaries change the result.
+    # Run-level metadata columns are left out, they differ on every run.
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.sums = [0, 0]
+        self.schema = ""
+
+    def update(self, df: pl.DataFrame) -> None:
+        data = df.select(sorted(col for col in df.columns if col not in METADATA_COLUMNS))
+        self.rows += len(data)
+        self.schema = repr(data.schema)
+        for i, seed in enumerate((0, 1)):
+            self.sums[i] = (self.sums[i] + int(data.hash_rows(seed=seed).sum())) & MASK_64
+
+    def digest(self) -> str:
+        schema = hashlib.sha1(self.schema.encode()).hexdigest()[:12]
+        return f"{self.rows}:{self.sums[0]:016x}{self.sums[1]:016x}:{schema}"
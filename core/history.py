@@ -0,0 +1,71 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from config.connections import get_postgres_connection
+from core import metadata
+from core.metadata import METADATA_COLUMNS, ROW_HASH, VALID_FROM, VALID_TO
+from core.write import _build_ddl_from_config, primary_key, stage_table
+
+if TYPE_CHECKING:
+    from bollhav import Model
+    from roskarl import DSN
+
+
+def _history_ddl(cfg: Model, key: list[str]) -> str:
+    # Several versions share a business key, so the key only becomes unique
+    # together with valid_from
+    key_cols = ", ".join(f'"{k}"' for k in key)
+    return (
+        f"{_build_ddl_from_config(cfg.columns, inline_keys=False)}, "
+        f'"{VALID_FROM}" TIMESTAMPTZ NOT NULL, '
+        f'"{VALID_TO}" TIMESTAMPTZ, '
+        f'"{ROW_HASH}" TEXT NOT NULL, '
+        f'PRIMARY KEY ({key_cols}, "{VALID_FROM}")'
+    )
+
+
+def apply_scd2(cfg: Model, dest_dsn: DSN) -> tuple[int, int]:
+    conn = get_postgres_connection(dest_dsn)
+    target = f"{cfg.schema}.{cfg.table}"
+    stage = stage_table(cfg)
+    key = primary_key(cfg)
+    names = [col.name for col in cfg.columns]
+    compared = [name for name in names if name not in key and name not in METADATA_COLUMNS]
+
+    on = " AND ".join(f't."{k}" = s."{k}"' for k in key)
+    key_cols = ", ".join(f'"{k}"' for k in key)
+    col_names = ", ".join(f'"{name}"' for name in names)
+    s_cols = ", ".join(f's."{name}"' for name in names)
+    # Hashed in the database rather than in Polars: the stored hash has to
+    # stay comparable across library upgrades, or every row would get a new
+    # version the day the hash function changes
+    s_row = ", ".join(f's."{name}"' for name in compared)
+    s_hash = f"md5(ROW({s_row})::text)" if compared else "''"
+    current = f'"{VALID_TO}" IS NULL'
+
+    with conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {target} ({_history_ddl(cfg, key)})")
+        conn.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {cfg.table}_current ON {target} ({key_cols}) WHERE {current}"
+        )
+        conn.execute(f"ANALYZE {stage}")
+
+        # Close current versions that changed or disappeared from the source
+        closed = conn.execute(
+            f'UPDATE {target} t SET "{VALID_TO}" = %s '
+            f"WHERE t.{current} AND NOT EXISTS ("
+            f'SELECT 1 FROM {stage} s WHERE {on} AND {s_hash} = t."{ROW_HASH}")',
+            (metadata.RUN_STARTED_AT,),
+        ).rowcount
+        # Open a version for every staged key without a current one: new keys
+        # and the ones just closed
+        opened = conn.execute(
+            f'INSERT INTO {target} ({col_names}, "{VALID_FROM}", "{VALID_TO}", "{ROW_HASH}") '
+            f"SELECT {s_cols}, %s, NULL, {s_hash} FROM {stage} s "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {target} t WHERE {on} AND t.{current})",
+            (metadata.RUN_STARTED_AT,),
+        ).rowcount
+        conn.execute(f"DROP TABLE {stage}")
+        conn.commit()
+
+    return opened, closed
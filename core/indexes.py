@@ -0,0 +1,84 @@
+from __future__ import annotations
+import copy
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from config.connections import get_postgres_connection
+
+if TYPE_CHECKING:
+    from bollhav import Model
+    from roskarl import DSN
+
+# Declared indexes are dropped before a TRUNCATE_INSERT load and built once
+# afterwards, in the background, so COPY does not maintain them row by row.
+# Builds of up to INDEX_BUILD_CONCURRENCY tables run at a time, each with
+# INDEX_BUILD_WORKERS parallel maintenance workers.
+INDEX_BUILD_CONCURRENCY = int(os.environ.get("INDEX_BUILD_CONCURRENCY", "2"))
+INDEX_BUILD_WORKERS = int(os.environ.get("INDEX_BUILD_WORKERS", "4"))
+INDEX_BUILD_MEMORY = os.environ.get("INDEX_BUILD_MEMORY", "1GB")
+
+_executor: ThreadPoolExecutor | None = None
+_pending: list[tuple[str, Future]] = []
+
+
+def index_name(cfg: Model, columns: list[str]) -> str:
+    # Postgres truncates identifiers at 63 bytes
+    return f"{cfg.table}_{'_'.join(columns)}_idx".lower()[:63]
+
+
+def drop_indexes(cfg: Model, dest_dsn: DSN, indexes: list[list[str]]) -> None:
+    conn = get_postgres_connection(dest_dsn)
+    with conn:
+        for columns in indexes:
+            conn.execute(f"DROP INDEX IF EXISTS {cfg.schema}.{index_name(cfg, columns)}")
+        conn.commit()
+
+
+def build_indexes(cfg: Model, dest_dsn: DSN, indexes: list[list[str]]) -> None:
+    started = time.monotonic()
+    conn = get_postgres_connection(dest_dsn)
+    with conn:
+        conn.execute(f"SET max_parallel_maintenance_workers = {INDEX_BUILD_WORKERS}")
+        conn.execute(f"SET maintenance_work_mem = '{INDEX_BUILD_MEMORY}'")
+        for columns in indexes:
+            col_names = ", ".join(f'"{col}"' for col in columns)
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name(cfg, columns)} "
+                f"ON {cfg.schema}.{cfg.table} ({col_names})"
+            )
+            # Committed one by one: a failing index does not undo the others
+            conn.commit()
+    print(f"  ✓ {cfg.name}: {len(indexes)} index(es) ready in {time.monotonic() - started:.1f}s")
+
+
+def ensure_brin(cfg: Model, dest_dsn: DSN, columns: list[str]) -> None:
+    # Tiny and cheap to build: one range summary per 128 pages. Only useful
+    # on tables written in the order of its columns
+    name = f"{cfg.table}_{'_'.join(columns)}_brin".lower()[:63]
+    col_names = ", ".join(f'"{col}"' for col in columns)
+    conn = get_postgres_connection(dest_dsn)
+    with conn:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {cfg.schema}.{cfg.table} USING brin ({col_names})")
+        conn.commit()
+
+
+def schedule_build(cfg: Model, dest_dsn: DSN, indexes: list[list[str]]) -> None:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=INDEX_BUILD_CONCURRENCY, thread_name_prefix="index")
+    # A copy: the build runs after run() has put a shadowed model's schema back
+    _pending.append((cfg.name, _executor.submit(build_indexes, copy.copy(cfg), dest_dsn, indexes)))
+
+
+def wait_for_indexes() -> list[str]:
+    failed = []
+    while _pending:
+        name, future = _pending.pop(0)
+        try:
+            future.result()
+        except Exception as e:
+            print(f"✗ {name} index build failed: {e}")
+            failed.append(name)
+    return failed
@@ -14,9 +14,9 @@ def print_model_list(models: dict) -> None:
     print()
 
 
-def print_summary(successes: int, failures: int) -> None:
+def print_summary(successes: int, failures: int, skipped: int = 0, unchanged: int = 0) -> None:
     print(f"\n{'=' * 60}")
-    print(f"Summary: {successes} succeeded, {failures} failed")
+    print(f"Summary: {successes} succeeded, {failures} failed, {skipped} skipped, {unchanged} unchanged")
     print("=" * 60)
 
 
@@ -28,6 +28,10 @@ def print_failure(name: str, error: Exception) -> None:
     print(f"✗ {name} failed: {error}")
 
 
+def print_skipped(name: str, reason: Exception) -> None:
+    print(f"⏭ {name} skipped: {reason}")
+
+
 def exit_with_error(message: str) -> None:
     print(f"Error: {message}")
     sys.exit(1)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from config.connections import get_postgres_connection
+from core.fanout import destination
+from core.state import ensure_state_table, set_state
+
+if TYPE_CHECKING:
+    from bollhav import Model
+    from roskarl import DSN
+
+# Every table written in a run is analyzed once its loads are done, so the
+# next queries are planned on current statistics instead of waiting for
+# autovacuum. Tables whose dead rows exceed VACUUM_DEAD_RATIO of all rows
+# (MERGE window deletes, upserts) are vacuumed too.
+MAINTENANCE_CONCURRENCY = int(os.environ.get("MAINTENANCE_CONCURRENCY", "4"))
+VACUUM_DEAD_RATIO = float(os.environ.get("VACUUM_DEAD_RATIO", "0.1"))
+MAINTENANCE_KEY = "maintenance"
+
+# Partitioned tables have no statistics row of their own; their partitions do
+DEAD_ROWS_QUERY = """
+SELECT COALESCE(SUM(n_dead_tup), 0), COALESCE(SUM(n_live_tup), 0)
+FROM pg_stat_user_tables
+WHERE relid = %(table)s::regclass
+   OR relid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %(table)s::regclass)
+"""
+
+_written: dict[tuple[str, str], tuple[Model, DSN]] = {}
+
+
+def record_written(cfg: Model, dest_dsn: DSN) -> None:
+    _written[(destination(dest_dsn), f"{cfg.schema}.{cfg.table}")] = (cfg, dest_dsn)
+
+
+def _maintain(table: str, cfg: Model, dest_dsn: DSN) -> dict:
+    conn = get_postgres_connection(dest_dsn)
+    # VACUUM refuses to run inside a transaction block
+    conn.autocommit = True
+    timings = {}
+    with conn:
+        dead, live = conn.execute(DEAD_ROWS_QUERY, {"table": table}).fetchone()
+        timings["dead_ratio"] = round(dead / max(1, dead + live), 4)
+        if timings["dead_ratio"] > VACUUM_DEAD_RATIO:
+            started = time.monotonic()
+            conn.execute(f"VACUUM {table}")
+            timings["vacuum_s"] = round(time.monotonic() - started, 2)
+        started = time.monotonic()
+        conn.execute(f"ANALYZE {table}")
+        timings["analyze_s"] = round(time.monotonic() - started, 2)
+        ensure_state_table(conn)
+        set_state(conn, cfg, MAINTENANCE_KEY, json.dumps(timings))
+    return timings
+
+
+def run_maintenance() -> None:
+    # Best effort: the loads are committed either way, a failed ANALYZE only
+    # leaves the statistics to autovacuum
+    if not _written:
+        return
+    tables = dict(_written)
+    _written.clear()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=MAINTENANCE_CONCURRENCY, thread_name_prefix="maintenance") as executor:
+        futures = {
+            (target, table): executor.submit(_maintain, table, cfg, dsn)
+            for (target, table), (cfg, dsn) in tables.items()
+        }
+        fanned_out = len({target for target, _ in futures}) > 1
+        for (target, table), future in futures.items():
+            if fanned_out:
+                table = f"{table} @ {target}"
+            try:
+                timings = future.result()
+            except Exception as e:
+                print(f"  ⚠ {table}: maintenance failed: {e}")
+                continue
+            vacuum = f", vacuumed in {timings['vacuum_s']}s" if "vacuum_s" in timings else ""
+            print(f"  ✓ {table}: analyzed in {timings['analyze_s']}s{vacuum} ({timings['dead_ratio']:.1%} dead)")
+    print(f"Maintenance: {len(tables)} table(s) in {time.monotonic() - started:.1f}s")
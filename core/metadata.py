@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import polars as pl
+
+# Taken once per run, so every batch and every model of a run carries the
+# same load timestamp. A long-running watcher starts a new run per trigger.
+RUN_STARTED_AT = datetime.now()
+
+
+def start_run() -> None:
+    global RUN_STARTED_AT
+    RUN_STARTED_AT = datetime.now()
+
+DATA_MODIFIED = "_data_modified"
+METADATA_MODIFIED = "_metadata_modified"
+METADATA_COLUMNS = (DATA_MODIFIED, METADATA_MODIFIED)
+
+# Version columns of SCD2 history tables, maintained by the loader
+VALID_FROM = "valid_from"
+VALID_TO = "valid_to"
+ROW_HASH = "_row_hash"
+
+# Tenant key of cross-tenant unified tables
+TENANT = "_tenant"
+
+# Change Tracking operation of a staged row: I, U or D; NULL for snapshot rows
+OPERATION = "_operation"
+
+
+def with_metadata(df: pl.DataFrame, columns: list | None) -> pl.DataFrame:
+    # Only columns the model declares and the source did not deliver are
+    # added; MERGE models still select their own _data_modified.
+    declared = {col.name for col in columns} if columns else set()
+    missing = [name for name in METADATA_COLUMNS if name in declared and name not in df.columns]
+    if not missing:
+        return df
+
+    literals = {
+        DATA_MODIFIED: pl.lit(RUN_STARTED_AT.date(), dtype=pl.Date),
+        METADATA_MODIFIED: pl.lit(RUN_STARTED_AT, dtype=pl.Datetime("us")),
+    }
+    return df.with_columns(literals[name].alias(name) for name in missing)
@@ -0,0 +1,17 @@
+from enum import Enum
+
+
+class LoadMode(Enum):
+    # How run() applies a model's extract, on top of bollhav's WriteMode.
+    # UPSERT takes a full snapshot (TRUNCATE_INSERT) and applies only the
+    # rows that differ, matched on the columns declared primary_key=True.
+    # SCD2 keeps every version of those rows, closing and opening versions
+    # with valid_from/valid_to only where the row changed.
+    # INCREMENTAL reads only rows after a stored watermark on the model's
+    # key and appends them, or upserts them when a primary key is declared.
+    # CHANGES applies a Change Tracking feed (read_changes) the same way,
+    # deleting what the source deleted.
+    UPSERT = "UPSERT"
+    SCD2 = "SCD2"
+    INCREMENTAL = "INCREMENTAL"
+    CHANGES = "CHANGES"
@@ -0,0 +1,128 @@
+import os
+from datetime import date, datetime, timedelta
+
+import psycopg
+from core.metadata import DATA_MODIFIED
+
+# MERGE tables are range-partitioned on _data_modified so a window replace
+# truncates whole partitions instead of deleting rows out of one big heap.
+# PARTITION_RETENTION > 0 keeps that many intervals (counting the current
+# one) and drops older partitions after each window replace.
+PARTITION_INTERVAL = os.environ.get("PARTITION_INTERVAL", "month").lower()
+PARTITION_RETENTION = int(os.environ.get("PARTITION_RETENTION", "0"))
+
+_SUFFIX_FORMATS = {"day": "%Y%m%d", "month": "%Y%m", "year": "%Y"}
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def floor(value: date) -> date:
+    if PARTITION_INTERVAL == "day":
+        return value
+    if PARTITION_INTERVAL == "month":
+        return value.replace(day=1)
+    if PARTITION_INTERVAL == "year":
+        return value.replace(month=1, day=1)
+    raise ValueError(f"Unknown PARTITION_INTERVAL: {PARTITION_INTERVAL}")
+
+
+def shift(lower: date, intervals: int) -> date:
+    if PARTITION_INTERVAL == "day":
+        return lower + timedelta(days=intervals)
+    if PARTITION_INTERVAL == "month":
+        months = lower.year * 12 + lower.month - 1 + intervals
+        return date(months // 12, months % 12 + 1, 1)
+    return date(lower.year + intervals, 1, 1)
+
+
+def bounds(start, end) -> list[tuple[date, date]]:
+    # Every partition overlapping [start, end)
+    start, end = _as_date(start), _as_date(end)
+    result = []
+    lower = floor(start)
+    while lower < end:
+        upper = shift(lower, 1)
+        result.append((lower, upper))
+        lower = upper
+    return result
+
+
+def partition_name(table: str, lower: date) -> str:
+    return f"{table}_p{lower.strftime(_SUFFIX_FORMATS[PARTITION_INTERVAL])}"
+
+
+def partition_clause() -> str:
+    return f'PARTITION BY RANGE ("{DATA_MODIFIED}")'
+
+
+def is_partitioned(conn: psycopg.Connection, schema: str, table: str) -> bool:
+    row = conn.execute(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = %s AND c.relname = %s",
+        (schema, table),
+    ).fetchone()
+    return row is not None and row[0] == "p"
+
+
+def ensure_partitions(conn: psycopg.Connection, schema: str, table: str, start, end) -> None:
+    for lower, upper in bounds(start, end):
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {schema}.{partition_name(table, lower)} "
+            f"PARTITION OF {schema}.{table} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+
+
+def ensure_default_partition(conn: psycopg.Connection, schema: str, table: str) -> None:
+    # Rows without a _data_modified have no range to go to. Every other row
+    # gets its range partition before the COPY, so only those land here.
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {schema}.{f'{table}_default'[:63]} PARTITION OF {schema}.{table} DEFAULT"
+    )
+
+
+def replace_window(conn: psycopg.Connection, schema: str, table: str, since, until) -> None:
+    # Partitions inside the window are truncated; only the edges of a window
+    # that does not line up with partition bounds are deleted row by row
+    since, until = _as_date(since), _as_date(until)
+    for lower, upper in bounds(since, until):
+        if since <= lower and upper <= until:
+            conn.execute(f"TRUNCATE TABLE {schema}.{partition_name(table, lower)}")
+        else:
+            conn.execute(
+                f'DELETE FROM {schema}.{table} WHERE "{DATA_MODIFIED}" >= %s AND "{DATA_MODIFIED}" < %s',
+                (max(lower, since), min(upper, until)),
+            )
+
+
+def drop_expired(conn: psycopg.Connection, schema: str, table: str, today: date) -> list[str]:
+    if PARTITION_RETENTION <= 0:
+        return []
+    cutoff = shift(floor(today), 1 - PARTITION_RETENTION)
+    children = conn.execute(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "JOIN pg_namespace n ON n.oid = p.relnamespace "
+        "WHERE n.nspname = %s AND p.relname = %s",
+        (schema, table),
+    ).fetchall()
+
+    dropped = []
+    prefix = f"{table}_p"
+    for (name,) in children:
+        if not name.startswith(prefix):
+            continue
+        try:
+            lower = datetime.strptime(name[len(prefix):], _SUFFIX_FORMATS[PARTITION_INTERVAL]).date()
+        except ValueError:
+            continue
+        if lower < cutoff:
+            conn.execute(f"DROP TABLE {schema}.{name}")
+            dropped.append(name)
+    return dropped
@@ -0,0 +1,62 @@
+import hashlib
+import os
+
+from bollhav import WriteMode
+from core.read import connect
+from core.stats import entity_stats
+
+# How a TRUNCATE_INSERT model's source is checked for changes before it is
+# extracted: "stats" uses row count and last modification from the cached
+# source statistics, falling back to "checksum" when the modification time is
+# unknown (no DMV access, or no writes since the last SQL Server restart).
+# "checksum" aggregates BINARY_CHECKSUM over the model's query on the source.
+SOURCE_PROBE = os.environ.get("SOURCE_PROBE", "off").lower()
+SOURCE_PROBE_KEY = "source_probe"
+
+CHECKSUM_QUERY = """
+SELECT COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM (
+{query}
+) AS q
+"""
+
+
+def probeable(module) -> bool:
+    return (
+        SOURCE_PROBE in ("stats", "checksum")
+        and hasattr(module, "source")
+        and hasattr(module, "query")
+        and module.config.write_mode == WriteMode.TRUNCATE_INSERT
+    )
+
+
+def _checksum(module) -> str:
+    conn = connect(module.source)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(CHECKSUM_QUERY.format(query=module.query))
+        row_count, checksum = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    return f"checksum:{row_count}:{checksum}"
+
+
+def _stats(module) -> str | None:
+    stats = entity_stats(module.source, module.config.source_entity)
+    if stats is None or stats.last_modified is None:
+        return None
+    return f"stats:{stats.row_count}:{stats.last_modified.isoformat()}"
+
+
+def probe(module) -> str | None:
+    # The query and declared columns are part of the token, so editing a
+    # model reloads it even when the source table has not changed
+    model = hashlib.sha1(
+        (module.query + repr([(c.name, c.data_type.value) for c in module.config.columns])).encode()
+    ).hexdigest()[:12]
+    try:
+        token = (_stats(module) if SOURCE_PROBE == "stats" else None) or _checksum(module)
+    except Exception as e:
+        print(f"  ⚠ {module.config.name}: change probe failed, loading anyway: {e}")
+        return None
+    return f"{token}:{model}"
@@ -0,0 +1,78 @@
+from __future__ import annotations
+import json
+import os
+from typing import TYPE_CHECKING
+
+import polars as pl
+import psycopg
+from core import metadata
+from core.state import STATE_SCHEMA, model_id
+
+if TYPE_CHECKING:
+    from bollhav import Model
+
+# With QUARANTINE, a batch whose COPY fails is split in half under savepoints
+# until the rows Postgres rejects are isolated. The good rows are written
+# and the rejects go to sidewinder.quarantine with their error, in the same
+# transaction. More than QUARANTINE_MAX_ROWS rejects in one batch means
+# something is wrong beyond a few bad values, and the batch fails as before.
+QUARANTINE = os.environ.get("QUARANTINE", "false").lower() == "true"
+QUARANTINE_MAX_ROWS = int(os.environ.get("QUARANTINE_MAX_ROWS", "100"))
+QUARANTINE_TABLE = "quarantine"
+
+
+def ensure_quarantine_table(conn: psycopg.Connection) -> None:
+    conn.execute(f"CREATE SCHEMA IF NOT EXISTS {STATE_SCHEMA}")
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {STATE_SCHEMA}.{QUARANTINE_TABLE} ("
+        '"model" TEXT NOT NULL, '
+        '"target" TEXT NOT NULL, '
+        '"run_started_at" TIMESTAMPTZ NOT NULL, '
+        '"row" JSONB NOT NULL, '
+        '"error" TEXT NOT NULL, '
+        '"quarantined_at" TIMESTAMPTZ NOT NULL DEFAULT now())'
+    )
+
+
+def _attempt(conn: psycopg.Connection, copy, table: str, df: pl.DataFrame) -> psycopg.Error | None:
+    # Bad values and constraint violations only; anything else fails the batch
+    conn.execute("SAVEPOINT quarantine")
+    try:
+        copy(conn, table, df)
+    except (psycopg.DataError, psycopg.IntegrityError) as e:
+        conn.execute("ROLLBACK TO SAVEPOINT quarantine")
+        conn.execute("RELEASE SAVEPOINT quarantine")
+        return e
+    conn.execute("RELEASE SAVEPOINT quarantine")
+    return None
+
+
+def _bisect(conn, copy, table: str, df: pl.DataFrame, error: psycopg.Error, rejects: list) -> None:
+    if len(df) == 1:
+        rejects.append((df.row(0, named=True), str(error).strip()))
+        if len(rejects) > QUARANTINE_MAX_ROWS:
+            raise error
+        return
+    half = len(df) // 2
+    for part in (df.head(half), df.slice(half)):
+        failed = _attempt(conn, copy, table, part)
+        if failed is not None:
+            _bisect(conn, copy, table, part, failed, rejects)
+
+
+def copy_or_quarantine(conn: psycopg.Connection, cfg: Model, copy, table: str, df: pl.DataFrame) -> int:
+    error = _attempt(conn, copy, table, df)
+    if error is None:
+        return 0
+    rejects = []
+    _bisect(conn, copy, table, df, error, rejects)
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {STATE_SCHEMA}.{QUARANTINE_TABLE} ("model", "target", "run_started_at", "row", "error") '
+            "VALUES (%s, %s, %s, %s, %s)",
+            [
+                (model_id(cfg), table, metadata.RUN_STARTED_AT, json.dumps(row, default=str), message)
+                for row, message in rejects
+            ],
+        )
+    return len(rejects)
@@ -1,29 +1,335 @@
+import os
 from collections.abc import Generator
 import polars as pl
-from config.connections import get_mssql_connection
+import pyodbc
+from config.connections import get_mssql_connection, mssql_profile
+from config.type_mapping import polars_schema_from_columns
+from core.metadata import METADATA_COLUMNS, OPERATION
 from roskarl import env_var_dsn
 
+# After this many consecutive connection failures a source is considered down
+# and its remaining models fail fast instead of each waiting out a timeout.
+CIRCUIT_BREAKER_THRESHOLD = int(os.environ.get("CIRCUIT_BREAKER_THRESHOLD", "3"))
+_connect_failures: dict[str, int] = {}
 
-def read(env_var_name: str, query: str, batch_size: int | None = None) -> Generator[pl.DataFrame, None, None]:
+# Result sets fetched ahead of time by read_many, keyed by (env var, query).
+# read() hands these out instead of querying the source again.
+_primed: dict[tuple[str, str], pl.DataFrame] = {}
+
+# Streaming batch sizes chosen by the runner from source table statistics,
+# used when the model itself does not ask for one.
+_planned_batch_sizes: dict[tuple[str, str], int] = {}
+
+
+def _column(name: str, values: list, dtype: pl.DataType | None) -> pl.Series:
+    delivered = pl.Series(name, values)
+    if dtype is None or delivered.dtype == dtype:
+        return delivered
+    try:
+        cast = delivered.cast(dtype)
+    except pl.exceptions.InvalidOperationError:
+        return delivered
+    # Rescaling decimals and floats to integers round instead of failing
+    if delivered.dtype.is_numeric() and not cast.cast(delivered.dtype).eq_missing(delivered).all():
+        return delivered
+    return cast
+
+
+def _to_frame(rows: list, columns: list[str], schema: dict[str, pl.DataType]) -> pl.DataFrame:
+    # Declared columns get their dtype up front; anything the model does not
+    # declare is still inferred from the values. A column whose values do not
+    # all convert exactly keeps what the source delivered, so validation and
+    # COPY see the offending values instead of NULLs.
+    return pl.DataFrame([_column(col, [row[i] for row in rows], schema.get(col)) for i, col in enumerate(columns)])
+
+
+class SourceUnavailable(Exception):
+    pass
+
+
+def source_available(env_var_name: str) -> bool:
+    return _connect_failures.get(env_var_name, 0) < CIRCUIT_BREAKER_THRESHOLD
+
+
+def reset_source(env_var_name: str) -> None:
+    _connect_failures.pop(env_var_name, None)
+
+
+def connect(env_var_name: str) -> pyodbc.Connection:
+    if not source_available(env_var_name):
+        raise SourceUnavailable(
+            f"{env_var_name}: skipped after {_connect_failures[env_var_name]} consecutive connection failures"
+        )
     dsn = env_var_dsn(name=env_var_name)
-    conn = get_mssql_connection(dsn)
+    try:
+        conn = get_mssql_connection(dsn, mssql_profile(env_var_name))
+    except pyodbc.Error:
+        _connect_failures[env_var_name] = _connect_failures.get(env_var_name, 0) + 1
+        raise
+    _connect_failures.pop(env_var_name, None)
+    return conn
+
 
+def prime(env_var_name: str, query: str, df: pl.DataFrame) -> None:
+    _primed[(env_var_name, query)] = df
+
+
+def discard(env_var_name: str, query: str) -> None:
+    _primed.pop((env_var_name, query), None)
+
+
+def plan_batch_size(env_var_name: str, query: str, batch_size: int | None) -> None:
     if batch_size is None:
-        df = pl.read_database(query, conn)
-        conn.close()
-        yield df
+        _planned_batch_sizes.pop((env_var_name, query), None)
     else:
-        cursor = conn.cursor()
-        cursor.execute(query)
-        columns = [desc[0] for desc in cursor.description]
+        _planned_batch_sizes[(env_var_name, query)] = batch_size
+
+
+def read(
+    env_var_name: str,
+    query: str,
+    batch_size: int | None = None,
+    columns: list | None = None,
+    params: list | None = None,
+) -> Generator[pl.DataFrame, None, None]:
+    primed = _primed.pop((env_var_name, query), None)
+    if primed is not None:
+        yield primed
+        return
 
+    if batch_size is None:
+        batch_size = _planned_batch_sizes.get((env_var_name, query))
+
+    conn = connect(env_var_name)
+    schema = polars_schema_from_columns(columns) if columns else {}
+
+    cursor = conn.cursor()
+    # Bound parameters keep the SQL text identical across windows, so the
+    # source reuses one cached plan instead of compiling one per day
+    cursor.execute(query, *(params or []))
+    names = [desc[0] for desc in cursor.description]
+
+    if batch_size is None:
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        yield _to_frame(rows, names, schema)
+    else:
         while True:
             rows = cursor.fetchmany(batch_size)
             if not rows:
                 break
-            yield pl.DataFrame(
-                {col: [row[i] for row in rows] for i, col in enumerate(columns)}
-            )
+            yield _to_frame(rows, names, schema)
+
+        cursor.close()
+        conn.close()
+
+
+def read_many(
+    env_var_name: str,
+    queries: list[str],
+    columns: list[list | None] | None = None,
+) -> Generator[tuple[int, pl.DataFrame], None, None]:
+    conn = connect(env_var_name)
+    schemas = [polars_schema_from_columns(cols) if cols else {} for cols in columns or [None] * len(queries)]
 
+    cursor = conn.cursor()
+    try:
+        # NOCOUNT keeps row-count messages from showing up as extra result sets
+        cursor.execute("SET NOCOUNT ON;\n" + ";\n".join(queries))
+        index = 0
+        while True:
+            if cursor.description is not None:
+                names = [desc[0] for desc in cursor.description]
+                yield index, _to_frame(cursor.fetchall(), names, schemas[index])
+                index += 1
+            if not cursor.nextset():
+                break
+    finally:
         cursor.close()
         conn.close()
+
+
+def _keyset_predicate(key: list[str], after: list) -> tuple[str, list]:
+    # (k1, k2, ...) > (a, b, ...) spelled out so SQL Server can seek on it.
+    # NULLs sort first, so "greater than NULL" means any non-NULL value.
+    branches = []
+    params = []
+    for i, col in enumerate(key):
+        parts = []
+        for prev, value in zip(key[:i], after[:i]):
+            if value is None:
+                parts.append(f"[{prev}] IS NULL")
+            else:
+                parts.append(f"[{prev}] = ?")
+                params.append(value)
+        if after[i] is None:
+            parts.append(f"[{col}] IS NOT NULL")
+        else:
+            parts.append(f"[{col}] > ?")
+            params.append(after[i])
+        branches.append("(" + " AND ".join(parts) + ")")
+    return "WHERE " + " OR ".join(branches), params
+
+
+def read_keyset(
+    env_var_name: str,
+    query: str,
+    key: list[str],
+    batch_size: int,
+    after: list | None = None,
+    columns: list | None = None,
+    params: list | None = None,
+    retries: int = 3,
+) -> Generator[pl.DataFrame, None, None]:
+    # Key columns keep the type the source delivered, so the checkpoint taken
+    # from a batch resumes at exactly that key
+    schema = polars_schema_from_columns(columns) if columns else {}
+    schema = {name: dtype for name, dtype in schema.items() if name not in key}
+    order = ", ".join(f"[{col}]" for col in key)
+    failures = 0
+
+    # One ordered stream; the keyset predicate is only used to resume it after
+    # a dropped connection. Without an index on the key, ORDER BY sorts the
+    # window once per attempt.
+    while True:
+        predicate, keyset_params = _keyset_predicate(key, after) if after is not None else ("", [])
+        conn = None
+        try:
+            conn = connect(env_var_name)
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT * FROM (\n{query}\n) AS q {predicate} ORDER BY {order}",
+                [*(params or []), *keyset_params],
+            )
+            names = [desc[0] for desc in cursor.description]
+            positions = [names.index(col) for col in key]
+            pending = []
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                rows = pending + rows
+                # Rows sharing the last key may continue in the next fetch;
+                # they are held back so a batch never ends inside a key
+                last = [rows[-1][i] for i in positions]
+                cut = len(rows)
+                while cut and [rows[cut - 1][i] for i in positions] == last:
+                    cut -= 1
+                pending = rows[cut:]
+                if cut:
+                    after = [rows[cut - 1][i] for i in positions]
+                    failures = 0
+                    yield _to_frame(rows[:cut], names, schema)
+            if pending:
+                yield _to_frame(pending, names, schema)
+            cursor.close()
+            return
+        except pyodbc.Error as e:
+            failures += 1
+            if failures > retries:
+                raise
+            print(f"  ↻ {env_var_name}: stream broke after {after}, resuming ({failures}/{retries}): {e}")
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except pyodbc.Error:
+                    pass
+
+
+CHANGE_VERSION_QUERY = (
+    "SELECT CHANGE_TRACKING_CURRENT_VERSION(), CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID(?))"
+)
+
+
+def changes_query(table: str, query: str, key: list[str], columns: list[str]) -> str:
+    # Keys come from the change table, so deletes keep theirs; everything
+    # else from the model's query. A key that no longer joins was deleted
+    # after it was changed, so it is reported as a delete.
+    on = " AND ".join(f"q.[{k}] = ct.[{k}]" for k in key)
+    selected = [f"ct.[{k}] AS [{k}]" for k in key] + [f"q.[{col}] AS [{col}]" for col in columns if col not in key]
+    return (
+        f"SELECT CASE WHEN q.[{key[0]}] IS NULL THEN 'D' ELSE ct.SYS_CHANGE_OPERATION END AS [{OPERATION}], "
+        + ", ".join(selected)
+        + f"\nFROM CHANGETABLE(CHANGES {table}, ?) AS ct\nLEFT JOIN (\n{query}\n) AS q ON {on}"
+    )
+
+
+class ChangeFeed:
+    # Rows of a Change Tracking table changed since the version a model last
+    # synchronized, tagged with their operation in OPERATION. Without a usable
+    # version (first run, or cleaned up by retention) the whole query is read
+    # instead and `full` is set. `version` is what to store once iteration is
+    # done. `connect_fn` swaps the source for recorded fixtures.
+
+    def __init__(
+        self,
+        env_var_name: str,
+        table: str,
+        query: str,
+        key: list[str],
+        since: int | None = None,
+        columns: list | None = None,
+        batch_size: int = 100_000,
+        connect_fn=connect,
+    ) -> None:
+        # Without columns the change query selects only the keys, and the
+        # upsert would set every other column to NULL
+        if not columns:
+            raise ValueError(f"{table}: read_changes requires columns")
+        self.env_var_name = env_var_name
+        self.table = table
+        self.query = query
+        self.key = key
+        self.since = since
+        self.columns = columns
+        self.batch_size = batch_size
+        self.connect_fn = connect_fn
+        self.full = False
+        self.version: int | None = None
+
+    def __iter__(self) -> Generator[pl.DataFrame, None, None]:
+        schema = polars_schema_from_columns(self.columns) if self.columns else {}
+        conn = self.connect_fn(self.env_var_name)
+        try:
+            # The current version is taken before reading: changes committed
+            # while reading are fetched again next time, which the upsert absorbs
+            cursor = conn.cursor()
+            cursor.execute(CHANGE_VERSION_QUERY, self.table)
+            current, min_valid = cursor.fetchone()
+            if current is None or min_valid is None:
+                raise ValueError(f"{self.table}: change tracking is not enabled")
+
+            self.full = self.since is None or self.since < min_valid
+            if self.full:
+                cursor.execute(self.query)
+            else:
+                names = [col.name for col in self.columns if col.name not in METADATA_COLUMNS]
+                cursor.execute(changes_query(self.table, self.query, self.key, names), self.since)
+            names = [desc[0] for desc in cursor.description]
+
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                yield _to_frame(rows, names, schema)
+            cursor.close()
+            self.version = current
+        finally:
+            conn.close()
+
+
+def read_changes(
+    env_var_name: str,
+    table: str,
+    query: str,
+    key: list[str],
+    after: int | None = None,
+    columns: list | None = None,
+    batch_size: int = 100_000,
+    connect_fn=connect,
+) -> ChangeFeed:
+    return ChangeFeed(
+        env_var_name, table, query, key, since=after, columns=columns, batch_size=batch_size, connect_fn=connect_fn
+    )
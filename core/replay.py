@@ -0,0 +1,66 @@
+from __future__ import annotations
+import json
+from pathlib import Path
+
+# A stand-in for a source connection that answers from recorded result sets,
+# for readers that take a connect_fn (read_changes). A recording maps a marker
+# to the columns and rows of the statement containing it; markers are tried
+# in order, so list the more specific ones (CHANGETABLE) before the model's
+# query, which the change query embeds.
+#
+#   {"CHANGE_TRACKING_CURRENT_VERSION": {"columns": ["", ""], "rows": [[42, 7]]},
+#    "CHANGETABLE": {"columns": ["_operation", "LEVID", "NAMN"], "rows": [["U", 1, "a"]]}}
+
+
+class ReplayCursor:
+    def __init__(self, conn: ReplayConnection):
+        self.conn = conn
+        self.description = None
+        self._rows: list[tuple] = []
+
+    def execute(self, sql: str, *params) -> ReplayCursor:
+        self.conn.executed.append((sql, params))
+        for marker, recorded in self.conn.recording.items():
+            if marker in sql:
+                self.description = [(name,) for name in recorded["columns"]]
+                self._rows = [tuple(row) for row in recorded["rows"]]
+                return self
+        raise LookupError(f"no recorded result for: {sql[:80]}")
+
+    def fetchone(self) -> tuple | None:
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size: int) -> list[tuple]:
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self) -> list[tuple]:
+        return self.fetchmany(len(self._rows))
+
+    def close(self) -> None:
+        pass
+
+
+class ReplayConnection:
+    def __init__(self, recording: dict):
+        self.recording = recording
+        self.executed: list[tuple[str, tuple]] = []
+        self.closed = False
+
+    def cursor(self) -> ReplayCursor:
+        return ReplayCursor(self)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def load_recording(path: str | Path) -> dict:
+    return json.loads(Path(path).read_text())
+
+
+def replay(recording: dict):
+    # Every connect gets a fresh connection over the same recording
+    def connect_fn(env_var_name: str) -> ReplayConnection:
+        return ReplayConnection(recording)
+
+    return connect_fn
@@ -1,5 +1,27 @@
+import copy
+import json
+import os
+from dataclasses import dataclass
+import polars as pl
 from bollhav import Model, WriteMode
 from roskarl import DSN
+from core.modes import LoadMode
+
+# TRUNCATE_INSERT models whose extracted content hashes the same as at their
+# last successful load are not rewritten. Up to SKIP_UNCHANGED_MAX_ROWS rows
+# are held in memory for the comparison; larger extracts are written as they
+# stream and only have their hash recorded.
+SKIP_UNCHANGED = os.environ.get("SKIP_UNCHANGED", "false").lower() == "true"
+SKIP_UNCHANGED_MAX_ROWS = int(os.environ.get("SKIP_UNCHANGED_MAX_ROWS", "1000000"))
+CONTENT_HASH = "content_hash"
+WATERMARK = "watermark"
+CHANGE_VERSION = "change_version"
+
+# Checkpoints of windows that never completed (a backfill that was given up
+# on) are removed once they are this old and another window of the model
+# has completed
+CHECKPOINT_MAX_AGE_DAYS = int(os.environ.get("CHECKPOINT_MAX_AGE_DAYS", "7"))
+CHECKPOINT_PREFIX = "checkpoint:"
 
 
 def get_max_date(cfg: Model, dest_dsn: DSN) -> str | None:
@@ -19,41 +41,367 @@ def get_max_date(cfg: Model, dest_dsn: DSN) -> str | None:
         return None
 
 
-def run(cfg: Model, fn, env, dest_dsn: DSN) -> None:
-    from core.write import write
+def window(env) -> tuple[str | None, str | None]:
+    if env.backfill and env.backfill.enabled:
+        return env.backfill.since.strftime("%Y-%m-%d"), env.backfill.until.strftime("%Y-%m-%d")
+    if env.cron and env.cron.enabled:
+        return env.cron.since.strftime("%Y-%m-%d"), env.cron.until.strftime("%Y-%m-%d")
+    return None, None
+
+
+@dataclass
+class LoadOptions:
+    key: list[str] | None = None
+    load_mode: LoadMode | None = None
+    indexes: list[list[str]] | None = None
+    cluster: list[str] | bool = False
+
+
+def _checkpoint_key(since: str | None, until: str | None) -> str:
+    return f"{CHECKPOINT_PREFIX}{since or ''}:{until or ''}"
+
+
+def run(
+    cfg: Model,
+    fn,
+    env,
+    dest_dsn: DSN | list[DSN],
+    key: list[str] | None = None,
+    load_mode: LoadMode | None = None,
+    indexes: list[list[str]] | None = None,
+    cluster: list[str] | bool = False,
+) -> None:
+    from core.fanout import destinations, fan_out, load_each
+    from core.sinks import is_parquet
+
+    options = LoadOptions(key, load_mode, indexes, cluster)
+    dsns = destinations(dest_dsn)
+    # A Parquet dataset is written once; the first destination keeps its state
+    if len(dsns) == 1 or is_parquet(cfg):
+        _load(cfg, fn, env, dsns[0], options)
+    elif load_mode == LoadMode.CHANGES:
+        load_each(cfg, dsns, lambda target, dsn: _load(target, fn, env, dsn, options))
+    else:
+        fan_out(cfg, fn, env, dsns, lambda target, fn, env, dsn: _load(target, fn, env, dsn, options), key=key)
+
+
+def _load(cfg: Model, fn, env, dest_dsn: DSN, options: LoadOptions) -> None:
+    from core.shadow import SHADOW_SCHEMAS, register, shadow_schema
+    from core.sinks import is_parquet
+    from core.unified import ensure_tenant_partition, unified
+
+    # Parquet versions are published atomically on their own
+    if is_parquet(cfg):
+        _run(cfg, fn, env, dest_dsn, options)
+        return
+
+    if unified(cfg):
+        if options.load_mode is not None:
+            raise ValueError(f"{cfg.name}: unified tables support TRUNCATE_INSERT, MERGE and APPEND only")
+        # The model loads straight into its tenant's partition, so TRUNCATE
+        # and window deletes never reach another tenant's rows
+        live = cfg.schema, cfg.table
+        cfg.schema, cfg.table = ensure_tenant_partition(cfg, dest_dsn)
+        try:
+            _run(cfg, fn, env, dest_dsn, options, tenant=live[0])
+        finally:
+            cfg.schema, cfg.table = live
+        return
+
+    if not (SHADOW_SCHEMAS and cfg.write_mode == WriteMode.TRUNCATE_INSERT and options.load_mode is None):
+        _run(cfg, fn, env, dest_dsn, options)
+        return
+
+    # Everything below writes to the shadow schema; state stays keyed on the
+    # live name (model_id), and main publishes the tenant once it succeeded
+    live = cfg.schema
+    cfg.schema = shadow_schema(live)
+    try:
+        written = _run(cfg, fn, env, dest_dsn, options)
+    finally:
+        cfg.schema = live
+    if written:
+        register(live, cfg.table, dest_dsn)
+
+
+def _run(cfg: Model, fn, env, dest_dsn: DSN, options: LoadOptions, tenant: str | None = None) -> int:
+    from core.fingerprint import ContentHash
+    from core.history import apply_scd2
+    from core.indexes import drop_indexes, ensure_brin, schedule_build
+    from core.maintenance import record_written
+    from core.metadata import DATA_MODIFIED, TENANT, with_metadata
+    from core.shadow import after_publish, live_schema
+    from core.sinks import PostgresSink, sink_for
+    from core.state import clear_stale_states, clear_state, load_state, save_state
+    from core.quarantine import QUARANTINE
+    from core.validate import VALIDATE_FRAMES, validate
+    from core.write import apply_upsert, primary_key, write_stage
 
     if not dest_dsn:
         raise ValueError(f"{cfg.name}: dest_dsn must be set")
+    key, load_mode, indexes, cluster = options.key, options.load_mode, options.indexes, options.cluster
 
-    since = None
-    until = None
+    # UPSERT and SCD2 stage the full extract and apply the difference at the
+    # end; INCREMENTAL does too when the model declares a primary key, so rows
+    # at or behind the watermark that come back are updated, not duplicated
+    incremental = load_mode == LoadMode.INCREMENTAL
+    if incremental and not key:
+        raise ValueError(f"{cfg.name}: INCREMENTAL requires a watermark key")
+    tracked = load_mode == LoadMode.CHANGES
+    staged = load_mode in (LoadMode.UPSERT, LoadMode.SCD2, LoadMode.CHANGES) or (
+        incremental and any(col.primary_key for col in cfg.columns or [])
+    )
+    if staged:
+        primary_key(cfg)
+    # Keys missing from the extract are deleted (or closed), which is only
+    # right when the extract is the whole table
+    if load_mode in (LoadMode.UPSERT, LoadMode.SCD2) and cfg.write_mode != WriteMode.TRUNCATE_INSERT:
+        raise ValueError(f"{cfg.name}: {load_mode.value} requires a full-snapshot TRUNCATE_INSERT model")
 
-    if env.backfill and env.backfill.enabled:
-        since = env.backfill.since.strftime("%Y-%m-%d")
-        until = env.backfill.until.strftime("%Y-%m-%d")
-    elif env.cron and env.cron.enabled:
-        since = env.cron.since.strftime("%Y-%m-%d")
-        until = env.cron.until.strftime("%Y-%m-%d")
+    sink = sink_for(cfg, dest_dsn)
+    postgres = isinstance(sink, PostgresSink)
+    if not postgres and load_mode is not None:
+        raise ValueError(f"{cfg.name}: load_mode requires a Postgres destination")
+    if not postgres:
+        indexes = None
+
+    # Rows are written in cluster key order, so a date window's rows share
+    # a contiguous run of pages that a BRIN index can point to
+    if cluster is True:
+        cluster = [DATA_MODIFIED]
+
+    since, until = window(env)
 
     if cfg.write_mode == WriteMode.MERGE and not since:
-        since = get_max_date(cfg, dest_dsn)
+        since = sink.max_date(cfg)
 
     total_rows = 0
     first_batch = True
     original_mode = cfg.write_mode
 
-    for df in fn(env, cfg):
-        if len(df) == 0:
-            continue
-        write(cfg, df, dest_dsn, since=since, until=until)
+    dropped = False
+
+    def flush(df, checkpoint=None) -> None:
+        nonlocal dropped, first_batch, total_rows
+        # A full reload builds its indexes once at the end instead of
+        # maintaining them per row; staged loads COPY into the bare stage
+        if indexes and first_batch and cfg.write_mode == WriteMode.TRUNCATE_INSERT and not staged:
+            drop_indexes(cfg, dest_dsn, indexes)
+            dropped = True
+        if cluster:
+            df = df.sort(cluster, nulls_last=True)
+        # Quarantine lets Postgres pick out the bad rows instead
+        if VALIDATE_FRAMES and not (QUARANTINE and postgres):
+            validate(cfg, df)
+        if staged:
+            write_stage(cfg, df, dest_dsn, truncate=first_batch, checkpoint=checkpoint)
+        else:
+            sink.write(cfg, df, since=since, until=until, checkpoint=checkpoint)
         if first_batch:
             cfg.write_mode = WriteMode.APPEND
             first_batch = False
         total_rows += len(df)
 
-    cfg.write_mode = original_mode
+    # Keyed models checkpoint the last key of every written batch, so a failed
+    # run picks up after it instead of re-extracting the whole window.
+    # INCREMENTAL models keep that checkpoint across runs as their watermark.
+    checkpoint_key = WATERMARK if incremental else _checkpoint_key(since, until)
+    after = None
+    last_key = None
+    if key:
+        saved = load_state(cfg, dest_dsn, checkpoint_key)
+        after = json.loads(saved) if saved else None
+    if tracked:
+        saved = load_state(cfg, dest_dsn, CHANGE_VERSION)
+        after = int(saved) if saved else None
+    # A change feed always starts a fresh stage; its version is not a resume
+    # point within one
+    if tracked:
+        if after is not None:
+            print(f"  ↻ {cfg.name}: reading changes after version {after}")
+    elif incremental:
+        if after is not None:
+            print(f"  ↻ {cfg.name}: loading after watermark {dict(zip(key, after))}")
+        cfg.write_mode = WriteMode.APPEND
+    elif after is not None:
+        print(f"  ↻ {cfg.name}: resuming after {dict(zip(key, after))}")
+        cfg.write_mode = WriteMode.APPEND
+        first_batch = False
+
+    content = None
+    held = None
+    if SKIP_UNCHANGED and original_mode == WriteMode.TRUNCATE_INSERT:
+        content = ContentHash()
+        held = []
 
-    if total_rows == 0:
+    # Appending and MERGE loads commit batch by batch with their checkpoint;
+    # a TRUNCATE_INSERT or Parquet load replaces the table once, at commit
+    if not staged:
+        sink.begin(cfg, since, until)
+    try:
+        frames = fn(env, cfg, after=after) if key or tracked else fn(env, cfg)
+        for df in frames:
+            if len(df) == 0:
+                continue
+            df = with_metadata(df, cfg.columns)
+            if tenant is not None:
+                df = df.with_columns(pl.lit(tenant).alias(TENANT))
+            if content is not None:
+                content.update(df)
+            if held is not None:
+                held.append(df)
+                if content.rows <= SKIP_UNCHANGED_MAX_ROWS:
+                    continue
+                for pending in held:
+                    flush(pending)
+                held = None
+                continue
+            checkpoint = None
+            if key:
+                last_key = json.dumps(list(df.select(key).row(-1)), default=str)
+                # A staged watermark only moves once the stage is applied
+                if not (incremental and staged):
+                    checkpoint = (checkpoint_key, last_key)
+            flush(df, checkpoint)
+
+        if held:
+            if content.digest() == load_state(cfg, dest_dsn, CONTENT_HASH):
+                print(f"  ⏭ {cfg.name}: unchanged since last load, skipping")
+                sink.abort()
+                return 0
+            for pending in held:
+                flush(pending)
+        sink.commit()
+    except BaseException:
+        sink.abort()
+        # A failed load does not leave the table without its indexes
+        if dropped:
+            schedule_build(cfg, dest_dsn, indexes)
+        raise
+    finally:
+        cfg.write_mode = original_mode
+
+    if indexes and not staged:
+        schedule_build(cfg, dest_dsn, indexes)
+
+    changes = None
+    versions = None
+    if load_mode == LoadMode.UPSERT and total_rows:
+        changes = apply_upsert(cfg, dest_dsn, order_by=cluster)
+    if load_mode == LoadMode.SCD2 and total_rows:
+        versions = apply_scd2(cfg, dest_dsn)
+    if incremental and staged and total_rows:
+        changes = apply_upsert(cfg, dest_dsn, delete=False, order_by=cluster)
+        save_state(cfg, dest_dsn, WATERMARK, last_key)
+    if tracked:
+        # Only a full read replaces the table; a change feed touches just the
+        # keys it lists. The version is stored even without changes, so a
+        # quiet table does not fall behind change retention.
+        if getattr(frames, "version", None) is None:
+            raise ValueError(f"{cfg.name}: CHANGES requires extract to return read_changes(...)")
+        if total_rows:
+            changes = apply_upsert(cfg, dest_dsn, delete=frames.full, order_by=cluster)
+        save_state(cfg, dest_dsn, CHANGE_VERSION, str(frames.version))
+
+    if key and not incremental:
+        clear_state(cfg, dest_dsn, checkpoint_key)
+        stale = clear_stale_states(cfg, dest_dsn, CHECKPOINT_PREFIX, CHECKPOINT_MAX_AGE_DAYS)
+        if stale:
+            print(f"  ✓ {cfg.name}: removed {stale} abandoned checkpoint(s)")
+
+    # Recorded after the rows are committed: if this fails, the stale hash
+    # only ever causes one extra reload
+    if content is not None and total_rows:
+        digest = content.digest()
+        loaded = copy.copy(cfg)
+        save = lambda: save_state(loaded, dest_dsn, CONTENT_HASH, digest)
+        if live_schema(cfg.schema) != cfg.schema:
+            after_publish(cfg.schema, save)
+        else:
+            save()
+
+    # Staged targets may only exist once the stage has been applied
+    if indexes and staged:
+        schedule_build(cfg, dest_dsn, indexes)
+
+    if total_rows and postgres and cluster:
+        ensure_brin(cfg, dest_dsn, cluster)
+
+    if total_rows and postgres:
+        record_written(cfg, dest_dsn)
+
+    if total_rows == 0 and tracked:
+        print(f"  ⏭ {cfg.name}: no changes, now at version {frames.version}")
+    elif total_rows == 0:
         print(f"  ⏭ {cfg.name}: no data, skipping")
+    elif changes:
+        inserted, updated, deleted = changes
+        print(
+            f"  ✓ {cfg.name}: {total_rows:,} rows compared, "
+            f"{inserted:,} inserted, {updated:,} updated, {deleted:,} deleted"
+        )
+    elif versions:
+        opened, closed = versions
+        print(f"  ✓ {cfg.name}: {total_rows:,} rows compared, {opened:,} versions opened, {closed:,} closed")
     else:
         print(f"  ✓ {cfg.name}: {total_rows:,} rows written")
+
+    return total_rows
+
+
+def batchable(module) -> bool:
+    from core.stats import entity_stats, is_small
+
+    if not (
+        hasattr(module, "source")
+        and hasattr(module, "query")
+        and module.config.write_mode == WriteMode.TRUNCATE_INSERT
+    ):
+        return False
+    return is_small(entity_stats(module.source, module.config.source_entity))
+
+
+def plan_read(module) -> None:
+    from core.read import plan_batch_size
+    from core.stats import batch_size_for, entity_stats
+
+    # Large tables stream in batches sized from their average row width;
+    # small or unknown ones keep the eager single-frame read.
+    if hasattr(module, "source") and hasattr(module, "query"):
+        stats = entity_stats(module.source, module.config.source_entity)
+        plan_batch_size(module.source, module.query, batch_size_for(stats))
+
+
+def by_size(modules: list) -> list:
+    from core.stats import entity_stats
+
+    def rows(module) -> int:
+        stats = entity_stats(module.source, module.config.source_entity)
+        return stats.row_count if stats else 0
+
+    return sorted(modules, key=rows)
+
+
+def prefetch(source: str, modules: list):
+    from core.read import read_many, prime, discard
+
+    # Each module is yielded once its result set is primed, so its execute()
+    # reads from memory. Whatever was not reached when the batch fails is
+    # yielded anyway and falls back to its own query.
+    done = 0
+    try:
+        results = read_many(
+            source,
+            [m.query for m in modules],
+            [m.config.columns for m in modules],
+        )
+        for index, df in results:
+            module = modules[index]
+            prime(source, module.query, df)
+            done = index + 1
+            yield module
+            discard(source, module.query)
+    except Exception as e:
+        print(f"  ⚠ {source}: batched read failed, falling back to one query per model: {e}")
+
+    yield from modules[done:]
@@ -0,0 +1,82 @@
+from __future__ import annotations
+import os
+from typing import TYPE_CHECKING, Callable
+
+from config.connections import get_postgres_connection
+from core.fanout import destination
+
+if TYPE_CHECKING:
+    from roskarl import DSN
+
+# With SHADOW_SCHEMAS, TRUNCATE_INSERT models load into <schema>__shadow.
+# Once every model of a schema (tenant) has succeeded, all of its freshly
+# loaded tables replace their live counterparts in one transaction, so
+# consumers never see half of a tenant reloaded. Tables of other modes keep
+# loading in place.
+SHADOW_SCHEMAS = os.environ.get("SHADOW_SCHEMAS", "false").lower() == "true"
+SHADOW_LOCK_TIMEOUT = os.environ.get("SHADOW_LOCK_TIMEOUT", "30s")
+SHADOW_SUFFIX = "__shadow"
+
+_loaded: dict[tuple[str, str], tuple[DSN, set[str]]] = {}
+_deferred: dict[str, list[Callable[[], None]]] = {}
+
+
+def shadow_schema(schema: str) -> str:
+    return f"{schema}{SHADOW_SUFFIX}"
+
+
+def live_schema(schema: str) -> str:
+    return schema.removesuffix(SHADOW_SUFFIX)
+
+
+def register(schema: str, table: str, dest_dsn: DSN) -> None:
+    _loaded.setdefault((schema, destination(dest_dsn)), (dest_dsn, set()))[1].add(table)
+
+
+def after_publish(schema: str, save: Callable[[], None]) -> None:
+    # State that says a model is loaded (content hash, probe token) is only
+    # true once its tenant is live; stored before that, a failed publish
+    # would have the next run skip the model and never publish it
+    _deferred.setdefault(live_schema(schema), []).append(save)
+
+
+def _swap(schema: str, dest_dsn: DSN, tables: set[str]) -> None:
+    shadow = shadow_schema(schema)
+    conn = get_postgres_connection(dest_dsn)
+    with conn:
+        # Readers of a live table hold the swap up; give up rather than queue
+        # every new reader behind the waiting ACCESS EXCLUSIVE lock
+        conn.execute(f"SET lock_timeout = '{SHADOW_LOCK_TIMEOUT}'")
+        for table in sorted(tables):
+            conn.execute(f"DROP TABLE IF EXISTS {schema}.{table}")
+            conn.execute(f"ALTER TABLE {shadow}.{table} SET SCHEMA {schema}")
+        conn.commit()
+
+
+def publish(failed_schemas: set[str]) -> list[str]:
+    failed = []
+    loaded = dict(_loaded)
+    _loaded.clear()
+    deferred = dict(_deferred)
+    _deferred.clear()
+    for (schema, _), (dest_dsn, tables) in sorted(loaded.items()):
+        if schema in failed_schemas:
+            print(f"  ⏭ {schema}: not published, live tables kept (shadow left in {shadow_schema(schema)})")
+            continue
+        try:
+            _swap(schema, dest_dsn, tables)
+        except Exception as e:
+            print(f"✗ {schema} publish failed: {e}")
+            failed.append(schema)
+            continue
+        print(f"  ✓ {schema}: published {len(tables)} table(s)")
+
+    for schema, saves in sorted(deferred.items()):
+        if schema in failed_schemas or schema in failed:
+            continue
+        for save in saves:
+            try:
+                save()
+            except Exception as e:
+                print(f"  ⚠ {schema}: could not store load state: {e}")
+    return failed
@@ -0,0 +1,210 @@
+from __future__ import annotations
+import abc
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import polars as pl
+from core.metadata import DATA_MODIFIED
+
+if TYPE_CHECKING:
+    from bollhav import Model
+    from roskarl import DSN
+
+# Models declared with database=Database.PARQUET are written as a Hive-
+# partitioned, zstd-compressed Parquet dataset under
+# PARQUET_ROOT/<schema>/<table>/current, one _data_modified=<day> directory per
+# day. Every load builds a new version directory, hard-linking the files it
+# keeps from the previous one, and publishes it once all of its batches are
+# written by swapping the current symlink, so readers never see a
+# half-loaded dataset.
+PARQUET_ROOT = os.environ.get("PARQUET_ROOT", "data/parquet")
+PARQUET_KEEP_VERSIONS = int(os.environ.get("PARQUET_KEEP_VERSIONS", "2"))
+CURRENT = "current"
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+class Sink(abc.ABC):
+    @abc.abstractmethod
+    def begin(self, cfg: Model, since: str | None = None, until: str | None = None) -> None: ...
+
+    @abc.abstractmethod
+    def commit(self) -> None: ...
+
+    @abc.abstractmethod
+    def abort(self) -> None: ...
+
+    @abc.abstractmethod
+    def write(
+        self,
+        cfg: Model,
+        df: pl.DataFrame,
+        since: str | None = None,
+        until: str | None = None,
+        checkpoint: tuple[str, str] | None = None,
+    ) -> None: ...
+
+    @abc.abstractmethod
+    def max_date(self, cfg: Model) -> str | None: ...
+
+
+class PostgresSink(Sink):
+    def __init__(self, dest_dsn: DSN):
+        self.dest_dsn = dest_dsn
+        self.replacing = None
+        self.names = None
+        self.checkpoint = None
+
+    def begin(self, cfg: Model, since: str | None = None, until: str | None = None) -> None:
+        # A TRUNCATE_INSERT is written to a stage and replaces the table's
+        # rows in one short transaction at commit: readers keep the previous
+        # rows, unblocked, while the source is read, and a failed load leaves
+        # them in place
+        self.replacing = cfg if cfg.write_mode.value == "TRUNCATE_INSERT" else None
+        self.names = None
+        self.checkpoint = None
+
+    def commit(self) -> None:
+        from core.write import replace_from_stage
+
+        # An empty extract leaves the table as it was
+        if self.replacing is not None and self.names is not None:
+            replace_from_stage(self.replacing, self.dest_dsn, self.names, self.checkpoint)
+        self.abort()
+
+    def abort(self) -> None:
+        self.replacing = None
+        self.names = None
+        self.checkpoint = None
+
+    def write(self, cfg, df, since=None, until=None, checkpoint=None) -> None:
+        from core.write import write, write_stage
+
+        if self.replacing is None:
+            write(cfg, df, self.dest_dsn, since=since, until=until, checkpoint=checkpoint)
+            return
+        write_stage(cfg, df, self.dest_dsn, truncate=self.names is None, not_null=True)
+        if self.names is None:
+            self.names = df.columns
+        if checkpoint:
+            self.checkpoint = checkpoint
+
+    def max_date(self, cfg: Model) -> str | None:
+        from core.run import get_max_date
+
+        return get_max_date(cfg, self.dest_dsn)
+
+
+def _day(path: Path) -> str | None:
+    name = path.parts[0]
+    if not name.startswith(f"{DATA_MODIFIED}="):
+        return None
+    return name.split("=", 1)[1]
+
+
+class ParquetSink(Sink):
+    # State (checkpoints, content hashes) stays in the Postgres destination
+    def __init__(self, dest_dsn: DSN, root: str = PARQUET_ROOT):
+        self.dest_dsn = dest_dsn
+        self.root = Path(root)
+        self.cfg = None
+        self.version = None
+        self.checkpoint = None
+        self.written = False
+
+    def _dataset(self, cfg: Model) -> Path:
+        return self.root / cfg.schema / cfg.table
+
+    def _current(self, cfg: Model) -> Path | None:
+        link = self._dataset(cfg) / CURRENT
+        return link.resolve() if link.exists() else None
+
+    def _files(self, version: Path, df: pl.DataFrame) -> None:
+        name = f"part-{uuid.uuid4().hex}.parquet"
+        if DATA_MODIFIED not in df.columns:
+            df.write_parquet(version / name, compression="zstd")
+            return
+        day = pl.col(DATA_MODIFIED).cast(pl.Date).cast(pl.String).fill_null(NULL_PARTITION)
+        for part in df.with_columns(day.alias("_day")).partition_by("_day"):
+            directory = version / f"{DATA_MODIFIED}={part['_day'][0]}"
+            directory.mkdir(exist_ok=True)
+            # Hive readers take the column from the directory name
+            part.drop("_day", DATA_MODIFIED).write_parquet(directory / name, compression="zstd")
+
+    def _publish(self, dataset: Path, version: Path) -> None:
+        link = dataset / CURRENT
+        pending = dataset / f".{CURRENT}-{version.name}"
+        os.symlink(version.name, pending)
+        os.replace(pending, link)
+        # Readers that resolved an older version may still be reading it
+        versions = sorted(path for path in dataset.glob("v*") if path.is_dir())
+        for old in versions[:-PARQUET_KEEP_VERSIONS]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def begin(self, cfg: Model, since: str | None = None, until: str | None = None) -> None:
+        dataset = self._dataset(cfg)
+        dataset.mkdir(parents=True, exist_ok=True)
+        mode = cfg.write_mode.value
+        current = self._current(cfg)
+        self.cfg = cfg
+        self.version = dataset / f"v{time.time_ns()}"
+        self.version.mkdir()
+        self.checkpoint = None
+        self.written = False
+
+        # Same semantics as Postgres: TRUNCATE_INSERT keeps nothing, MERGE
+        # keeps the days outside its window, APPEND keeps everything
+        if current is not None and mode != "TRUNCATE_INSERT":
+            for path in current.rglob("*.parquet"):
+                relative = path.relative_to(current)
+                day = _day(relative)
+                if mode == "MERGE" and since and until and day and since <= day < until:
+                    continue
+                (self.version / relative).parent.mkdir(parents=True, exist_ok=True)
+                os.link(path, self.version / relative)
+
+    def write(self, cfg, df, since=None, until=None, checkpoint=None) -> None:
+        self._files(self.version, df)
+        self.written = True
+        if checkpoint:
+            self.checkpoint = checkpoint
+
+    def commit(self) -> None:
+        from core.state import save_state
+
+        if self.version is None:
+            return
+        # An empty extract leaves the dataset as it was, like Postgres does
+        if not self.written:
+            self.abort()
+            return
+        self._publish(self.version.parent, self.version)
+        # Stored after the swap: a crash in between reloads the whole window
+        if self.checkpoint:
+            save_state(self.cfg, self.dest_dsn, *self.checkpoint)
+        self.version = None
+
+    def abort(self) -> None:
+        if self.version is not None:
+            shutil.rmtree(self.version, ignore_errors=True)
+            self.version = None
+
+    def max_date(self, cfg: Model) -> str | None:
+        current = self._current(cfg)
+        if current is None:
+            return None
+        days = [_day(path.relative_to(current)) for path in current.iterdir()]
+        days = [day for day in days if day and day != NULL_PARTITION]
+        return max(days) if days else None
+
+
+def is_parquet(cfg: Model) -> bool:
+    database = getattr(cfg, "database", None)
+    return database is not None and database.value == "PARQUET"
+
+
+def sink_for(cfg: Model, dest_dsn: DSN) -> Sink:
+    return ParquetSink(dest_dsn) if is_parquet(cfg) else PostgresSink(dest_dsn)
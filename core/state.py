@@ -0,0 +1,104 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+import psycopg
+from config.connections import get_postgres_connection
+from core.shadow import live_schema
+
+if TYPE_CHECKING:
+    from bollhav import Model
+    from roskarl import DSN
+
+# Per-model bookkeeping (checkpoints, watermarks, hashes) lives next to the
+# data in the destination, so it commits in the same transaction as a write.
+STATE_SCHEMA = "sidewinder"
+STATE_TABLE = "model_state"
+
+
+def model_id(cfg: Model) -> str:
+    # A model loading into its shadow schema keeps its live identity
+    return f"{live_schema(cfg.schema)}.{cfg.table}"
+
+
+def ensure_state_table(conn: psycopg.Connection) -> None:
+    conn.execute(f"CREATE SCHEMA IF NOT EXISTS {STATE_SCHEMA}")
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {STATE_SCHEMA}.{STATE_TABLE} ("
+        '"model" TEXT NOT NULL, '
+        '"key" TEXT NOT NULL, '
+        '"value" TEXT, '
+        '"updated_at" TIMESTAMPTZ NOT NULL DEFAULT now(), '
+        'PRIMARY KEY ("model", "key"))'
+    )
+
+
+def get_state(conn: psycopg.Connection, cfg: Model, key: str) -> str | None:
+    result = conn.execute(
+        f'SELECT "value" FROM {STATE_SCHEMA}.{STATE_TABLE} WHERE "model" = %s AND "key" = %s',
+        (model_id(cfg), key),
+    ).fetchone()
+    return result[0] if result else None
+
+
+def set_state(conn: psycopg.Connection, cfg: Model, key: str, value: str) -> None:
+    conn.execute(
+        f'INSERT INTO {STATE_SCHEMA}.{STATE_TABLE} ("model", "key", "value") VALUES (%s, %s, %s) '
+        'ON CONFLICT ("model", "key") DO UPDATE SET "value" = EXCLUDED."value", "updated_at" = now()',
+        (model_id(cfg), key, value),
+    )
+
+
+def delete_state(conn: psycopg.Connection, cfg: Model, key: str) -> None:
+    conn.execute(
+        f'DELETE FROM {STATE_SCHEMA}.{STATE_TABLE} WHERE "model" = %s AND "key" = %s',
+        (model_id(cfg), key),
+    )
+
+
+def load_state(cfg: Model, dest_dsn: DSN, key: str) -> str | None:
+    conn = get_postgres_connection(dest_dsn)
+    with conn:
+        ensure_state_table(conn)
+        conn.commit()
+        return get_state(conn, cfg, key)
+
+
+def load_states(dest_dsn: DSN, key: str) -> dict[str, str]:
+    conn = get_postgres_connection(dest_dsn)
+    with conn:
+        ensure_state_table(conn)
+        conn.commit()
+        rows = conn.execute(
+            f'SELECT "model", "value" FROM {STATE_SCHEMA}.{STATE_TABLE} WHERE "key" = %s',
+            (key,),
+        ).fetchall()
+    return dict(rows)
+
+
+def save_state(cfg: Model, dest_dsn: DSN, key: str, value: str) -> None:
+    conn = get_postgres_connection(dest_dsn)
+    with conn:
+        ensure_state_table(conn)
+        set_state(conn, cfg, key, value)
+        conn.commit()
+
+
+def clear_state(cfg: Model, dest_dsn: DSN, key: str) -> None:
+    conn = get_postgres_connection(dest_dsn)
+    with conn:
+        ensure_state_table(conn)
+        delete_state(conn, cfg, key)
+        conn.commit()
+
+
+def clear_stale_states(cfg: Model, dest_dsn: DSN, prefix: str, max_age_days: int) -> int:
+    conn = get_postgres_connection(dest_dsn)
+    with conn:
+        ensure_state_table(conn)
+        deleted = conn.execute(
+            f'DELETE FROM {STATE_SCHEMA}.{STATE_TABLE} WHERE "model" = %s AND "key" LIKE %s '
+            'AND "updated_at" < now() - make_interval(days => %s)',
+            (model_id(cfg), f"{prefix}%", max_age_days),
+        ).rowcount
+        conn.commit()
+    return deleted
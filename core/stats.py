@@ -0,0 +1,120 @@
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+import pyodbc
+from core.read import connect
+
+SOURCE_STATS_TTL = int(os.environ.get("SOURCE_STATS_TTL", "3600"))
+SMALL_TABLE_ROWS = int(os.environ.get("SMALL_TABLE_ROWS", "100000"))
+TARGET_BATCH_BYTES = 256 * 1024 * 1024
+MIN_BATCH_ROWS = 10_000
+
+# One pass over the catalog for every table in the database. Pages cover
+# every index of a table; rows only count the heap or clustered index so they
+# are not multiplied by the number of indexes.
+STATS_QUERY = """
+SELECT
+    s.name,
+    t.name,
+    SUM(CASE WHEN ps.index_id IN (0, 1) THEN ps.row_count ELSE 0 END),
+    SUM(ps.used_page_count),
+    MAX(u.last_user_update)
+FROM sys.tables t
+JOIN sys.schemas s ON s.schema_id = t.schema_id
+JOIN sys.dm_db_partition_stats ps ON ps.object_id = t.object_id
+LEFT JOIN (
+    SELECT object_id, MAX(last_user_update) AS last_user_update
+    FROM sys.dm_db_index_usage_stats
+    WHERE database_id = DB_ID()
+    GROUP BY object_id
+) u ON u.object_id = t.object_id
+GROUP BY s.name, t.name
+"""
+
+# Without VIEW DATABASE/SERVER STATE the DMVs are off limits; fall back to
+# what plain catalog visibility gives, without a modification time.
+STATS_QUERY_CATALOG = """
+SELECT
+    s.name,
+    t.name,
+    (SELECT SUM(p.rows) FROM sys.partitions p
+     WHERE p.object_id = t.object_id AND p.index_id IN (0, 1)),
+    (SELECT SUM(a.used_pages) FROM sys.partitions p
+     JOIN sys.allocation_units a ON a.container_id = p.partition_id
+     WHERE p.object_id = t.object_id),
+    NULL
+FROM sys.tables t
+JOIN sys.schemas s ON s.schema_id = t.schema_id
+"""
+
+
+@dataclass
+class TableStats:
+    schema: str
+    entity: str
+    row_count: int
+    used_pages: int
+    last_modified: datetime | None
+
+    @property
+    def bytes_per_row(self) -> int:
+        return max(1, self.used_pages * 8192 // max(1, self.row_count))
+
+
+_cache: dict[str, tuple[float, dict[str, TableStats]]] = {}
+
+
+def _probe(env_var_name: str) -> dict[str, TableStats]:
+    conn = connect(env_var_name)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(STATS_QUERY)
+        except pyodbc.Error:
+            cursor.execute(STATS_QUERY_CATALOG)
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+
+    stats: dict[str, TableStats] = {}
+    for schema, entity, row_count, used_pages, last_modified in rows:
+        entry = TableStats(schema, entity, int(row_count or 0), int(used_pages or 0), last_modified)
+        # The same entity can exist in several schemas; size for the largest
+        current = stats.get(entity.upper())
+        if current is None or entry.row_count > current.row_count:
+            stats[entity.upper()] = entry
+    return stats
+
+
+def source_stats(env_var_name: str, refresh: bool = False) -> dict[str, TableStats]:
+    cached = _cache.get(env_var_name)
+    if cached and not refresh and time.monotonic() - cached[0] < SOURCE_STATS_TTL:
+        return cached[1]
+
+    try:
+        stats = _probe(env_var_name)
+    except Exception as e:
+        # Planning is best effort: an unreachable catalog just means no hints.
+        # The empty result is cached too, so a down source is not re-probed
+        # for every one of its models.
+        print(f"  ⚠ {env_var_name}: table statistics unavailable: {e}")
+        stats = {}
+    _cache[env_var_name] = (time.monotonic(), stats)
+    return stats
+
+
+def entity_stats(env_var_name: str, entity: str) -> TableStats | None:
+    return source_stats(env_var_name).get(entity.upper())
+
+
+def is_small(stats: TableStats | None) -> bool:
+    return stats is None or stats.row_count <= SMALL_TABLE_ROWS
+
+
+def batch_size_for(stats: TableStats | None) -> int | None:
+    if is_small(stats):
+        return None
+    return max(MIN_BATCH_ROWS, TARGET_BATCH_BYTES // stats.bytes_per_row)
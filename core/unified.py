@@ -0,0 +1,72 @@
+from __future__ import annotations
+import os
+from typing import TYPE_CHECKING
+
+from config.connections import get_postgres_connection
+from core.metadata import DATA_MODIFIED, TENANT
+from core.partitions import partition_clause
+
+if TYPE_CHECKING:
+    from bollhav import Model
+    from roskarl import DSN
+
+# Tables listed in UNIFIED_TABLES are loaded from every tenant into one
+# UNIFIED_SCHEMA.<table>, list-partitioned on the tenant key the loader adds
+# (the model's own schema, e.g. raindance_raw_1210). Each tenant's load only
+# ever touches its own partition; MERGE tables are range-partitioned on
+# _data_modified below that.
+UNIFIED_SCHEMA = os.environ.get("UNIFIED_SCHEMA", "raindance")
+UNIFIED_TABLES = {t.strip() for t in os.environ.get("UNIFIED_TABLES", "").split(",") if t.strip()}
+
+
+def unified(cfg: Model) -> bool:
+    return cfg.table in UNIFIED_TABLES
+
+
+def tenant_partition(cfg: Model) -> str:
+    return f"{cfg.table}_{cfg.schema}"[:63]
+
+
+def _parent_columns(conn, table: str) -> dict[str, bool]:
+    rows = conn.execute(
+        "SELECT column_name, is_nullable = 'YES' FROM information_schema.columns "
+        "WHERE table_schema = %s AND table_name = %s",
+        (UNIFIED_SCHEMA, table),
+    ).fetchall()
+    return dict(rows)
+
+
+def ensure_tenant_partition(cfg: Model, dest_dsn: DSN) -> tuple[str, str]:
+    from core.write import _build_ddl_from_config
+
+    parent = f"{UNIFIED_SCHEMA}.{cfg.table}"
+    partition = f"{UNIFIED_SCHEMA}.{tenant_partition(cfg)}"
+    by_range = cfg.write_mode.value == "MERGE" and any(col.name == DATA_MODIFIED for col in cfg.columns)
+
+    conn = get_postgres_connection(dest_dsn)
+    with conn:
+        conn.execute(f"CREATE SCHEMA IF NOT EXISTS {UNIFIED_SCHEMA}")
+        # Tenants may declare different columns: the parent holds the union of
+        # them, all NULLable, and each tenant's NOT NULLs are set on its own
+        # partition. Key constraints would have to include the tenant (and
+        # range) keys.
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {parent} ("{TENANT}" TEXT NOT NULL) PARTITION BY LIST ("{TENANT}")')
+        existing = _parent_columns(conn, cfg.table)
+        for col in cfg.columns:
+            if col.name not in existing:
+                definition = _build_ddl_from_config([col], inline_keys=False, not_null=False)
+                conn.execute(f"ALTER TABLE {parent} ADD COLUMN IF NOT EXISTS {definition}")
+        for name, nullable in existing.items():
+            if not nullable and name != TENANT:
+                conn.execute(f'ALTER TABLE {parent} ALTER COLUMN "{name}" DROP NOT NULL')
+
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {partition} "
+            f"PARTITION OF {parent} FOR VALUES IN ('{cfg.schema}')"
+            + (f" {partition_clause()}" if by_range else "")
+        )
+        for col in cfg.columns:
+            if not col.nullable:
+                conn.execute(f'ALTER TABLE {partition} ALTER COLUMN "{col.name}" SET NOT NULL')
+        conn.commit()
+    return UNIFIED_SCHEMA, tenant_partition(cfg)
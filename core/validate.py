@@ -0,0 +1,108 @@
+from __future__ import annotations
+import os
+from typing import TYPE_CHECKING
+
+import polars as pl
+from config.type_mapping import polars_type_from_pg
+from core.metadata import OPERATION
+
+if TYPE_CHECKING:
+    from bollhav import Model
+
+# Every frame is checked against the declared columns before its COPY is
+# opened, so a bad value fails the batch in milliseconds with the offending
+# rows named, instead of after most of it was streamed and rolled back.
+VALIDATE_FRAMES = os.environ.get("VALIDATE_FRAMES", "true").lower() == "true"
+SAMPLE_ROWS = 5
+
+# The ISO forms a date or timestamp string is accepted in; Postgres takes
+# more, but these are what the sources deliver
+DATE_FORMATS = ["%Y-%m-%d", "%Y%m%d"]
+TIMESTAMP_FORMATS = [
+    "%Y-%m-%d %H:%M:%S%.f",
+    "%Y-%m-%dT%H:%M:%S%.f",
+    "%Y-%m-%d %H:%M:%S%.f%#z",
+    "%Y-%m-%dT%H:%M:%S%.f%#z",
+    "%Y-%m-%d %H:%M",
+]
+BOOLEAN_LITERALS = ["t", "true", "y", "yes", "on", "1", "f", "false", "n", "no", "off", "0"]
+
+
+class InvalidFrame(ValueError):
+    pass
+
+
+def _parses(text: pl.Expr, target: pl.DataType) -> pl.Expr | None:
+    if target == pl.Boolean:
+        return text.str.to_lowercase().is_in(BOOLEAN_LITERALS)
+    if target in (pl.Date, pl.Datetime):
+        # A timestamp may be a bare date and a date may carry a time
+        dates = [text.str.to_date(fmt, strict=False).is_not_null() for fmt in DATE_FORMATS]
+        times = [text.str.to_datetime(fmt, strict=False).is_not_null() for fmt in TIMESTAMP_FORMATS]
+        return pl.any_horizontal(dates + times)
+    return None
+
+
+def _checks(col, dtype: pl.DataType) -> list[tuple[str, pl.Expr]]:
+    column = pl.col(col.name)
+    target = polars_type_from_pg(col)
+    numeric = target is not None and target.is_numeric()
+    checks = []
+
+    value = column
+    if dtype.is_float():
+        # Written as NULL by _copy
+        value = pl.when(column.is_nan() | column.is_infinite()).then(None).otherwise(column)
+    if not col.nullable or col.primary_key:
+        checks.append(("NULL in NOT NULL column", value.is_null()))
+
+    if numeric and dtype == pl.String:
+        value = column.str.strip_chars().cast(pl.Float64, strict=False)
+        checks.append((f"not a valid {col.data_type.value}", column.is_not_null() & value.is_null()))
+    elif not dtype.is_numeric():
+        value = None
+        parsed = _parses(column.str.strip_chars(), target) if target is not None and dtype == pl.String else None
+        if parsed is not None:
+            checks.append((f"not a valid {col.data_type.value}", column.is_not_null() & ~parsed))
+
+    if col.length is not None and dtype == pl.String:
+        checks.append((f"longer than {col.length} characters", column.str.len_chars() > col.length))
+
+    # Extra scale is rounded by Postgres; only too many integer digits fail
+    if col.precision is not None and numeric and value is not None:
+        digits = col.precision - (col.scale or 0)
+        checks.append(
+            (f"out of range for NUMERIC({col.precision},{col.scale or 0})", value.cast(pl.Float64).abs() >= 10**digits)
+        )
+    return checks
+
+
+def problems(cfg: Model, df: pl.DataFrame) -> pl.DataFrame:
+    # One boolean column per failed check, named "<column>: <reason>"
+    checks = {}
+    for col in cfg.columns or []:
+        if col.name in df.columns:
+            for reason, expr in _checks(col, df[col.name].dtype):
+                checks[f"{col.name}: {reason}"] = expr.fill_null(False)
+    if not checks:
+        return pl.DataFrame()
+    # Staged Change Tracking deletes only carry their key
+    if OPERATION in df.columns:
+        live = pl.col(OPERATION).fill_null("") != "D"
+        checks = {label: expr & live for label, expr in checks.items()}
+    flags = df.select(expr.alias(label) for label, expr in checks.items())
+    return flags.select(name for name in flags.columns if flags[name].any())
+
+
+def validate(cfg: Model, df: pl.DataFrame) -> None:
+    flags = problems(cfg, df)
+    if flags.width == 0:
+        return
+    lines = []
+    for label in flags.columns:
+        rows = flags[label].arg_true()
+        column = label.split(": ", 1)[0]
+        values = df[column].gather(rows.head(SAMPLE_ROWS)).to_list()
+        sample = ", ".join(f"row {row}: {value!r}" for row, value in zip(rows.head(SAMPLE_ROWS).to_list(), values))
+        lines.append(f"  {label} in {len(rows):,} row(s) ({sample})")
+    raise InvalidFrame(f"{cfg.name}: batch of {len(df):,} rows failed validation\n" + "\n".join(lines))
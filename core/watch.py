@@ -0,0 +1,112 @@
+import os
+import time
+from dataclasses import dataclass
+
+from core.read import connect, reset_source
+from core.stats import source_stats
+
+# Polling instead of a fixed cron: a source's models run once its tables have
+# stopped changing for WATCH_DEBOUNCE seconds, or at the latest
+# WATCH_MAX_LATENCY seconds after the first change was seen. A source with an
+# export-completion marker (<SOURCE>_READY_QUERY, returning one value that
+# changes when an export finishes) runs as soon as that marker moves.
+WATCH_INTERVAL = int(os.environ.get("WATCH_INTERVAL", "60"))
+WATCH_DEBOUNCE = int(os.environ.get("WATCH_DEBOUNCE", "300"))
+WATCH_MAX_LATENCY = int(os.environ.get("WATCH_MAX_LATENCY", "3600"))
+
+
+@dataclass
+class Pending:
+    first_seen: float
+    last_seen: float
+    markers: dict
+
+
+def _markers(source: str, modules: list) -> dict[str, tuple]:
+    # Row count plus last modification per model; without DMV access the
+    # modification time is None and only row count deltas are seen
+    stats = source_stats(source, refresh=True)
+    markers = {}
+    for module in modules:
+        entry = stats.get(module.config.source_entity.upper())
+        if entry is not None:
+            markers[module.__name__] = (entry.row_count, entry.last_modified)
+    return markers
+
+
+def _ready(source: str):
+    query = os.environ.get(f"{source}_READY_QUERY")
+    if not query:
+        return None
+    try:
+        conn = connect(source)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query)
+            row = cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"  ⚠ {source}: ready marker unavailable: {e}")
+        return None
+    return row[0] if row else None
+
+
+def due(pending: Pending, now: float, ready_moved: bool) -> bool:
+    return (
+        ready_moved
+        or now - pending.last_seen >= WATCH_DEBOUNCE
+        or now - pending.first_seen >= WATCH_MAX_LATENCY
+    )
+
+
+def watch(modules: list, trigger, clock=time.monotonic, sleep=time.sleep) -> None:
+    # trigger(modules) runs the given modules and returns the names of the
+    # ones that failed; those keep their old marker and are picked up again
+    # after the next debounce.
+    by_source: dict[str, list] = {}
+    for module in modules:
+        if hasattr(module, "source"):
+            by_source.setdefault(module.source, []).append(module)
+
+    baseline = {source: _markers(source, mods) for source, mods in by_source.items()}
+    ready = {source: _ready(source) for source in by_source}
+    pending: dict[str, Pending] = {}
+    print(f"Watching {len(by_source)} source(s), polling every {WATCH_INTERVAL}s")
+
+    while True:
+        sleep(WATCH_INTERVAL)
+        for source, mods in sorted(by_source.items()):
+            # A source that was down gets a fresh chance on every poll
+            reset_source(source)
+            now = clock()
+            markers = _markers(source, mods)
+            marker = _ready(source)
+            ready_moved = marker is not None and marker != ready[source]
+            changed = [
+                m for m in mods
+                if m.__name__ in markers and markers[m.__name__] != baseline[source].get(m.__name__)
+            ]
+            if not changed and not ready_moved:
+                continue
+
+            entry = pending.get(source)
+            if entry is None:
+                entry = pending[source] = Pending(now, now, markers)
+                print(f"  ↻ {source}: {len(changed)} table(s) changing")
+            elif markers != entry.markers:
+                entry.last_seen = now
+                entry.markers = markers
+            if not due(entry, now, ready_moved):
+                continue
+
+            del pending[source]
+            # A completed export without visible table changes (no DMV
+            # access) still reloads the whole source
+            failed = set(trigger(changed or mods))
+            for module in changed or mods:
+                if module.__name__ not in failed and module.__name__ in markers:
+                    baseline[source][module.__name__] = markers[module.__name__]
+            if marker is not None:
+                ready[source] = marker
@@ -1,9 +1,21 @@
 from __future__ import annotations
+from datetime import date, datetime, timedelta
 from typing import TYPE_CHECKING
 
 import polars as pl
 from config.connections import get_postgres_connection
 from config.type_mapping import pg_type_from_polars
+from core.metadata import DATA_MODIFIED, METADATA_COLUMNS, OPERATION
+from core.partitions import (
+    drop_expired,
+    ensure_default_partition,
+    ensure_partitions,
+    is_partitioned,
+    partition_clause,
+    replace_window,
+)
+from core.quarantine import QUARANTINE, copy_or_quarantine, ensure_quarantine_table
+from core.state import STATE_SCHEMA, ensure_state_table, set_state
 
 if TYPE_CHECKING:
     from bollhav import Model
@@ -19,7 +31,7 @@ def _clean_row(row: tuple) -> tuple:
     )
 
 
-def _build_ddl_from_config(columns: list) -> str:
+def _build_ddl_from_config(columns: list, inline_keys: bool = True, not_null: bool = True) -> str:
     parts = []
     for col in columns:
         definition = f'"{col.name}" {col.data_type.value}'
@@ -30,11 +42,11 @@ def _build_ddl_from_config(columns: list) -> str:
                 definition += f"({col.precision})"
         if col.length is not None:
             definition += f"({col.length})"
-        if not col.nullable:
+        if not col.nullable and not_null:
             definition += " NOT NULL"
-        if col.primary_key:
+        if col.primary_key and inline_keys:
             definition += " PRIMARY KEY"
-        if col.unique and not col.primary_key:
+        if col.unique and not col.primary_key and inline_keys:
             definition += " UNIQUE"
         parts.append(definition)
     return ", ".join(parts)
@@ -46,39 +58,238 @@ def _build_ddl_from_df(df: pl.DataFrame) -> str:
     )
 
 
-def write(cfg: Model, df: pl.DataFrame, dest_dsn: DSN, since: str | None = None, until: str | None = None) -> None:
+def _copy(conn, table: str, df: pl.DataFrame) -> None:
+    col_names = ", ".join(f'"{col}"' for col in df.columns)
+    with conn.cursor() as cursor:
+        with cursor.copy(f"COPY {table} ({col_names}) FROM STDIN") as copy:
+            for row in df.rows():
+                copy.write_row(_clean_row(row))
+
+
+def _write_rows(conn, cfg: Model, table: str, df: pl.DataFrame) -> None:
+    if not QUARANTINE:
+        _copy(conn, table, df)
+        return
+    rejected = copy_or_quarantine(conn, cfg, _copy, table, df)
+    if rejected:
+        print(f"  ⚠ {cfg.name}: {rejected:,} of {len(df):,} rows quarantined")
+
+
+def _day_after(value) -> date:
+    if isinstance(value, datetime):
+        value = value.date()
+    return value + timedelta(days=1)
+
+
+def write(
+    cfg: Model,
+    df: pl.DataFrame,
+    dest_dsn: DSN,
+    since: str | None = None,
+    until: str | None = None,
+    checkpoint: tuple[str, str] | None = None,
+) -> None:
     conn = get_postgres_connection(dest_dsn)
     schema = cfg.schema
     table = cfg.table
-    columns = df.columns
-    col_defs = _build_ddl_from_config(cfg.columns) if cfg.columns else _build_ddl_from_df(df)
+    merge = cfg.write_mode.value == "MERGE"
+    names = [col.name for col in cfg.columns] if cfg.columns else df.columns
+    # New MERGE tables are partitioned on _data_modified; key constraints
+    # would have to include it, so they are left off there
+    partition = merge and DATA_MODIFIED in names
+    if cfg.columns:
+        col_defs = _build_ddl_from_config(cfg.columns, inline_keys=not partition)
+    else:
+        col_defs = _build_ddl_from_df(df)
 
     with conn:
         # DDL is separate — safe to commit alone
         conn.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
-        conn.execute(f"CREATE TABLE IF NOT EXISTS {schema}.{table} ({col_defs})")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {schema}.{table} ({col_defs})"
+            + (f" {partition_clause()}" if partition else "")
+        )
+        # Tables created before partitioning keep the plain DELETE below
+        partitioned = is_partitioned(conn, schema, table)
+    if partitioned:
+        ensure_default_partition(conn, schema, table)
+        if partitioned and DATA_MODIFIED in df.columns and df[DATA_MODIFIED].min() is not None:
+            ensure_partitions(conn, schema, table, df[DATA_MODIFIED].min(), _day_after(df[DATA_MODIFIED].max()))
+        if partitioned and merge and since and until:
+            ensure_partitions(conn, schema, table, since, until)
+        if checkpoint:
+            ensure_state_table(conn)
+        if QUARANTINE:
+            ensure_quarantine_table(conn)
         conn.commit()
 
         # Delete + insert in one transaction — all or nothing
         if cfg.write_mode.value == "TRUNCATE_INSERT":
             conn.execute(f"TRUNCATE TABLE {schema}.{table}")
 
-        if cfg.write_mode.value == "MERGE" and since and until:
-            conn.execute(
-                f'DELETE FROM {schema}.{table} WHERE "_data_modified" >= %s AND "_data_modified" < %s',
-                (since, until),
-            )
+        if merge and since and until:
+            if partitioned:
+                replace_window(conn, schema, table, since, until)
+            else:
+                conn.execute(
+                    f'DELETE FROM {schema}.{table} WHERE "_data_modified" >= %s AND "_data_modified" < %s',
+                    (since, until),
+                )
+
+        _write_rows(conn, cfg, f"{schema}.{table}", df)
+
+        # After the COPY, so rows of a backfill older than the retention
+        # still have a partition to land in before it goes
+        if partitioned and merge and since and until:
+            for name in drop_expired(conn, schema, table, date.today()):
+                print(f"  ✓ {cfg.name}: dropped expired partition {name}")
+
+        # The checkpoint commits with the rows it describes
+        if checkpoint:
+            set_state(conn, cfg, *checkpoint)
+
+        conn.commit()
+
+
+def primary_key(cfg: Model) -> list[str]:
+    key = [col.name for col in cfg.columns or [] if col.primary_key]
+    if not key:
+        raise ValueError(f"{cfg.name}: UPSERT and SCD2 require columns with primary_key=True")
+    return key
+
+
+def stage_table(cfg: Model) -> str:
+    # Next to the loader's state, out of the schemas consumers read
+    return f"{STATE_SCHEMA}.{f'_stage_{cfg.schema}_{cfg.table}'[:63]}"
+
+
+def write_stage(
+    cfg: Model,
+    df: pl.DataFrame,
+    dest_dsn: DSN,
+    truncate: bool = False,
+    checkpoint: tuple[str, str] | None = None,
+    not_null: bool = False,
+) -> None:
+    conn = get_postgres_connection(dest_dsn)
+    stage = stage_table(cfg)
+    # Without NOT NULL by default: staged deletes only carry their key, the
+    # target enforces everything else when the stage is applied
+    if cfg.columns:
+        col_defs = _build_ddl_from_config(cfg.columns, inline_keys=False, not_null=not_null)
+        # Columns the loader adds, like a unified table's tenant key
+        declared = {col.name for col in cfg.columns} | {OPERATION}
+        extra = df.select(name for name in df.columns if name not in declared)
+        if extra.width:
+            col_defs += f", {_build_ddl_from_df(extra)}"
+    else:
+        col_defs = _build_ddl_from_df(df)
+
+    with conn:
+        # Unlogged: the stage is rebuilt from the source whenever it is lost.
+        # Recreated by every load's first batch, so a stage left behind by a
+        # failed run never outlives a change to the model's columns.
+        conn.execute(f"CREATE SCHEMA IF NOT EXISTS {STATE_SCHEMA}")
+        if truncate:
+            conn.execute(f"DROP TABLE IF EXISTS {stage}")
+        conn.execute(f'CREATE UNLOGGED TABLE IF NOT EXISTS {stage} ({col_defs}, "{OPERATION}" CHAR(1))')
+        if checkpoint:
+            ensure_state_table(conn)
+        if QUARANTINE:
+            ensure_quarantine_table(conn)
+        conn.commit()
+
+        _write_rows(conn, cfg, stage, df)
+        if checkpoint:
+            set_state(conn, cfg, *checkpoint)
+        conn.commit()
+
+
+def replace_from_stage(
+    cfg: Model,
+    dest_dsn: DSN,
+    names: list[str],
+    checkpoint: tuple[str, str] | None = None,
+) -> None:
+    conn = get_postgres_connection(dest_dsn)
+    target = f"{cfg.schema}.{cfg.table}"
+    stage = stage_table(cfg)
+    col_names = ", ".join(f'"{name}"' for name in names)
 
-        col_names = ", ".join(f'"{col}"' for col in columns)
-        rows = df.rows()
+    with conn:
+        conn.execute(f"CREATE SCHEMA IF NOT EXISTS {cfg.schema}")
+        if cfg.columns:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {target} ({_build_ddl_from_config(cfg.columns)})")
+        else:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {target} AS SELECT {col_names} FROM {stage} WITH NO DATA")
+        if checkpoint:
+            ensure_state_table(conn)
+        conn.commit()
 
-        with conn.cursor() as cursor:
-            with cursor.copy(f"COPY {schema}.{table} ({col_names}) FROM STDIN") as copy:
-                for row in rows:
-                    copy.write_row(_clean_row(row))
+        # The table is only locked for this local copy, not for the extract
+        conn.execute(f"TRUNCATE TABLE {target}")
+        conn.execute(f"INSERT INTO {target} ({col_names}) SELECT {col_names} FROM {stage}")
+        conn.execute(f"DROP TABLE {stage}")
+        if checkpoint:
+            set_state(conn, cfg, *checkpoint)
+        conn.commit()
 
+
+def apply_upsert(
+    cfg: Model,
+    dest_dsn: DSN,
+    delete: bool = True,
+    order_by: list[str] | None = None,
+) -> tuple[int, int, int]:
+    conn = get_postgres_connection(dest_dsn)
+    target = f"{cfg.schema}.{cfg.table}"
+    stage = stage_table(cfg)
+    key = primary_key(cfg)
+    names = [col.name for col in cfg.columns]
+    # Metadata columns differ on every run and are not a change by themselves;
+    # they are carried along with the rows that did change.
+    compared = [name for name in names if name not in key and name not in METADATA_COLUMNS]
+
+    on = " AND ".join(f't."{k}" = s."{k}"' for k in key)
+    col_names = ", ".join(f'"{name}"' for name in names)
+    s_cols = ", ".join(f's."{name}"' for name in names)
+    assignments = ", ".join(f'"{name}" = s."{name}"' for name in names if name not in key)
+    t_row = ", ".join(f't."{name}"' for name in compared)
+    s_row = ", ".join(f's."{name}"' for name in compared)
+    # Staged Change Tracking deletes only carry their key
+    op = f's."{OPERATION}"'
+    live = f"{op} IS DISTINCT FROM 'D'"
+    # New rows land in cluster key order; the stage itself is unordered
+    s_order = ", ".join(f's."{name}"' for name in order_by or [])
+    order = f" ORDER BY {s_order}" if s_order else ""
+
+    # One transaction: readers see the old or the new table, and only the
+    # changed rows are locked and rewritten
+    with conn:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {target} ({_build_ddl_from_config(cfg.columns)})")
+        conn.execute(f"ANALYZE {stage}")
+        deleted = conn.execute(
+            f"DELETE FROM {target} t USING {stage} s WHERE {on} AND {op} = 'D'"
+        ).rowcount
+        if delete:
+            deleted += conn.execute(
+                f"DELETE FROM {target} t WHERE NOT EXISTS (SELECT 1 FROM {stage} s WHERE {on} AND {live})"
+            ).rowcount
+        updated = 0
+        if compared:
+            updated = conn.execute(
+                f"UPDATE {target} t SET {assignments} FROM {stage} s "
+                f"WHERE {on} AND {live} AND ROW({t_row}) IS DISTINCT FROM ROW({s_row})"
+            ).rowcount
+        inserted = conn.execute(
+            f"INSERT INTO {target} ({col_names}) SELECT {s_cols} "
+            f"FROM {stage} s WHERE {live} AND NOT EXISTS (SELECT 1 FROM {target} t WHERE {on}){order}"
+        ).rowcount
+        conn.execute(f"DROP TABLE {stage}")
         conn.commit()
 
+    return inserted, updated, deleted
+
 
 def write_view(cfg: Model, dest_dsn: DSN, view_query: str) -> None:
     conn = get_postgres_connection(dest_dsn)
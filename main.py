@@ -2,9 +2,22 @@ import sys
 import importlib
 import os
 from pathlib import Path
-from core.logger import print_header, print_model_list, print_summary, print_failure, exit_with_error
+from roskarl import env_var_dsn
+from core.logger import print_header, print_model_list, print_summary, print_failure, print_skipped, exit_with_error
+from core.indexes import wait_for_indexes
+from core.maintenance import run_maintenance
+from core.metadata import start_run
+from core.probe import SOURCE_PROBE, SOURCE_PROBE_KEY, probe, probeable
+from core.read import SourceUnavailable
+from core.run import batchable, by_size, plan_read, prefetch
+from core.shadow import SHADOW_SCHEMAS, after_publish, publish
+from core.state import load_states, model_id, save_state
+from core.watch import watch
 
 MODELS_DIR = Path(__file__).parent / "models"
+QUERY_BATCH_SIZE = int(os.environ.get("QUERY_BATCH_SIZE", "20"))
+DEST_ENV = os.environ.get("DEST_ENV")
+WATCH_ENABLED = os.environ.get("WATCH_ENABLED", "false").lower() == "true"
 
 
 def discover_models() -> dict:
@@ -18,6 +31,134 @@ def discover_models() -> dict:
     return models
 
 
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+UNCHANGED = "unchanged"
+
+
+def run_model(name: str, module) -> str:
+    try:
+        print_header(module.config.name)
+        module.execute()
+        return SUCCEEDED
+    except SourceUnavailable as e:
+        print_skipped(name, e)
+        return SKIPPED
+    except Exception as e:
+        print_failure(name, e)
+        return FAILED
+
+
+def run_models(available: dict[str, str]) -> dict[str, str]:
+    results: dict[str, str] = {}
+    schemas: dict[str, str] = {}
+    batches: dict[str, list] = {}
+
+    # Probe results from the last successful load of each model, compared
+    # before extraction and stored only once a load succeeded
+    dest_dsn = None
+    previous: dict[str, str] = {}
+    tokens: dict[str, str] = {}
+    if SOURCE_PROBE != "off":
+        if not DEST_ENV:
+            exit_with_error("SOURCE_PROBE requires DEST_ENV")
+        dest_dsn = env_var_dsn(DEST_ENV)
+        previous = load_states(dest_dsn, SOURCE_PROBE_KEY)
+
+    def finish(name: str, module) -> None:
+        outcome = run_model(name, module)
+        token = tokens.get(name)
+        if outcome == SUCCEEDED and token:
+            cfg = module.config
+            save = lambda: save_state(cfg, dest_dsn, SOURCE_PROBE_KEY, token)
+            # A shadowed load only counts once its tenant is published
+            if SHADOW_SCHEMAS:
+                after_publish(cfg.schema, save)
+            else:
+                try:
+                    save()
+                except Exception as e:
+                    print(f"  ⚠ {cfg.name}: could not store change probe: {e}")
+        results[name] = outcome
+
+    for name, import_path in sorted(available.items()):
+        try:
+            module = importlib.import_module(import_path)
+        except Exception as e:
+            print_failure(name, e)
+            results[name] = FAILED
+            continue
+        schemas[name] = module.config.schema
+        if probeable(module):
+            token = probe(module)
+            if token and token == previous.get(model_id(module.config)):
+                print(f"  ⏭ {module.config.name}: source unchanged, skipping")
+                results[name] = UNCHANGED
+                continue
+            if token:
+                tokens[name] = token
+        if QUERY_BATCH_SIZE > 1 and batchable(module):
+            batches.setdefault(module.source, []).append(module)
+            continue
+        plan_read(module)
+        finish(name, module)
+
+    # Small TRUNCATE_INSERT models on the same source share one round trip per
+    # batch, smallest first so each batch holds tables of similar size
+    for source, modules in sorted(batches.items()):
+        modules = by_size(modules)
+        for start in range(0, len(modules), QUERY_BATCH_SIZE):
+            for module in prefetch(source, modules[start:start + QUERY_BATCH_SIZE]):
+                finish(module.__name__.removeprefix("models."), module)
+
+    # Index builds run in the background while later models load
+    for name in wait_for_indexes():
+        results[f"{name} (indexes)"] = FAILED
+
+    # Statistics are refreshed once everything, indexes included, is loaded
+    run_maintenance()
+
+    # A tenant's shadow tables go live only if none of its models failed
+    failed_schemas = {
+        schemas[name] for name, outcome in results.items()
+        if name in schemas and outcome in (FAILED, SKIPPED)
+    }
+    for schema in publish(failed_schemas):
+        results[f"{schema} (publish)"] = FAILED
+
+    return results
+
+
+def summarize(results: dict[str, str]) -> dict[str, int]:
+    outcomes = {SUCCEEDED: 0, FAILED: 0, SKIPPED: 0, UNCHANGED: 0}
+    for outcome in results.values():
+        outcomes[outcome] += 1
+    print_summary(outcomes[SUCCEEDED], outcomes[FAILED], outcomes[SKIPPED], outcomes[UNCHANGED])
+    return outcomes
+
+
+def watch_models(available: dict[str, str]) -> None:
+    names = {import_path: name for name, import_path in available.items()}
+    modules = []
+    for name, import_path in sorted(available.items()):
+        try:
+            modules.append(importlib.import_module(import_path))
+        except Exception as e:
+            print_failure(name, e)
+
+    def trigger(changed: list) -> list[str]:
+        start_run()
+        results = run_models({names[m.__name__]: m.__name__ for m in changed})
+        summarize(results)
+        return [
+            available[name] for name, outcome in results.items()
+            if name in available and outcome in (FAILED, SKIPPED)
+        ]
+
+    watch(modules, trigger)
+
+
 def main():
     available = discover_models()
     tag_filter = os.environ.get("TAGS")
@@ -36,21 +177,12 @@ def main():
 
     print_model_list(available)
 
-    successes = 0
-    failures = 0
-
-    for name, import_path in sorted(available.items()):
-        try:
-            module = importlib.import_module(import_path)
-            print_header(module.config.name)
-            module.execute()
-            successes += 1
-        except Exception as e:
-            print_failure(name, e)
-            failures += 1
+    if WATCH_ENABLED:
+        watch_models(available)
+        return
 
-    print_summary(successes, failures)
-    sys.exit(0 if failures == 0 else 1)
+    outcomes = summarize(run_models(available))
+    sys.exit(0 if outcomes[FAILED] == 0 and outcomes[SKIPPED] == 0 else 1)
 
 
 main()
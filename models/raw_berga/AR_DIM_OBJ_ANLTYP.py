@@ -1,7 +1,7 @@
 from bollhav import Model, WriteMode
 from bollhav.postgres import PostgresColumn, PostgresType
 from bollhav.database import Database
-from core import read, write
+from core import read, run
 from roskarl.marshal import with_env_config, EnvConfig
 from roskarl import env_var_dsn
 
@@ -26,13 +26,9 @@ config = Model(
     tags=['berga', 'raindance', 'raw'],
 )
 
-@with_env_config
-def execute(env: EnvConfig, cfg=config):
-    dest_dsn = env_var_dsn("BIG_EKONOMI_EXECUTION_PROD")
-    query = """
+source = "RAINDANCE_2610"
+query = """
     SELECT
-	CAST(GETDATE() AS DATE) as _data_modified,
-	CAST(GETDATE() AS DATETIME2) as _metadata_modified,
 	COALESCE([ANLTYP_GILTIG_FOM], '1899-12-31 00:00:00') AS ANLTYP_GILTIG_FOM,
 	COALESCE([ANLTYP_GILTIG_TOM], '1899-12-31 00:00:00') AS ANLTYP_GILTIG_TOM,
 	[ANLTYP_ID] AS ANLTYP_ID,
@@ -42,14 +38,13 @@ def execute(env: EnvConfig, cfg=config):
     FROM [utdata].[utdata261].[AR_DIM_OBJ_ANLTYP]
 
     """
-    total_rows = 0
-    first_batch = True
-    for df in read("RAINDANCE_2610", query):
-        if len(df) == 0:
-            continue
-        write(cfg, df, dest_dsn)
-        if first_batch:
-            cfg.write_mode = WriteMode.APPEND
-            first_batch = False
-        total_rows += len(df)
-    print(f"  ✓ {cfg.name}: {total_rows:,} rows written" if total_rows else f"  ⏭ {cfg.name}: no data, skipping")
\ No newline at end of file
+
+
+def extract(env, cfg=config):
+    yield from read(source, query, columns=cfg.columns)
+
+
+@with_env_config
+def execute(env: EnvConfig, cfg=config):
+    dest_dsn = env_var_dsn("BIG_EKONOMI_EXECUTION_PROD")
+    run(cfg, extract, env, dest_dsn)
\ No newline at end of file
@@ -1,7 +1,7 @@
 from bollhav import Model, WriteMode
 from bollhav.postgres import PostgresColumn, PostgresType
 from bollhav.database import Database
-from core import read, write
+from core import read, run, window
 from roskarl.marshal import with_env_config, EnvConfig
 from roskarl import env_var_dsn
 
@@ -123,21 +123,10 @@ config = Model(
     tags=['dan', 'raindance', 'raw'],
 )
 
-@with_env_config
-def execute(env: EnvConfig, cfg=config):
-    dest_dsn = env_var_dsn("BIG_EKONOMI_EXECUTION_PROD")
-    if env.backfill and env.backfill.enabled:
-        since = env.backfill.since.strftime("%Y-%m-%d")
-        until = env.backfill.until.strftime("%Y-%m-%d")
-    elif env.cron and env.cron.enabled:
-        since = env.cron.since.strftime("%Y-%m-%d")
-        until = env.cron.until.strftime("%Y-%m-%d")
-    else:
-        raise ValueError(f"{cfg.name}: MERGE requires CRON or BACKFILL env vars")
-    query = f"""
+source = "RAINDANCE_8510"
+query = """
     SELECT
 	CAST(VERDATUM AS DATE) as _data_modified,
-	CAST(GETDATE() AS DATETIME2) as _metadata_modified,
 	[ATTEST] AS ATTEST,
 	COALESCE([ATTESTDATUM1], '1899-12-31 00:00:00') AS ATTESTDATUM1,
 	COALESCE([ATTESTDATUM2], '1899-12-31 00:00:00') AS ATTESTDATUM2,
@@ -242,16 +231,18 @@ def execute(env: EnvConfig, cfg=config):
 	[XLEVID_ID] AS XLEVID_ID,
 	[YG_ID] AS YG_ID
     FROM [raindance_udp].[udp_150].[RK_FAKTA_LEVFAKT_VERIFIKAT]
-    WHERE CAST(VERDATUM AS DATE) BETWEEN '{since}' AND '{until}'
+    WHERE CAST(VERDATUM AS DATE) BETWEEN ? AND ?
     """
-    total_rows = 0
-    first_batch = True
-    for df in read("RAINDANCE_8510", query, batch_size=500_000):
-        if len(df) == 0:
-            continue
-        write(cfg, df, dest_dsn, since=since, until=until)
-        if first_batch:
-            cfg.write_mode = WriteMode.APPEND
-            first_batch = False
-        total_rows += len(df)
-    print(f"  ✓ {cfg.name}: {total_rows:,} rows written" if total_rows else f"  ⏭ {cfg.name}: no data, skipping")
\ No newline at end of file
+
+
+def extract(env, cfg=config):
+    since, until = window(env)
+    if since is None:
+        raise ValueError(f"{cfg.name}: MERGE requires CRON or BACKFILL env vars")
+    yield from read(source, query, batch_size=500_000, params=[since, until], columns=cfg.columns)
+
+
+@with_env_config
+def execute(env: EnvConfig, cfg=config):
+    dest_dsn = env_var_dsn("BIG_EKONOMI_EXECUTION_PROD")
+    run(cfg, extract, env, dest_dsn)
\ No newline at end of file
@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import pytest
+from bollhav.postgres import PostgresColumn, PostgresType
+from core.read import read_changes
+from core.replay import load_recording, replay
+
+RECORDING = Path(__file__).parent / "fixtures" / "rk_dim_lev_changes.json"
+TABLE = "[utdata].[utdata261].[RK_DIM_LEV]"
+QUERY = f"SELECT [LEVID] AS LEVID, [NAMN] AS NAMN, [ORGNR] AS ORGNR FROM {TABLE}"
+KEY = ["LEVID"]
+COLUMNS = [
+    PostgresColumn(name="_data_modified", data_type=PostgresType.DATE),
+    PostgresColumn(name="LEVID", data_type=PostgresType.NUMERIC, nullable=False, primary_key=True),
+    PostgresColumn(name="NAMN", data_type=PostgresType.TEXT),
+    PostgresColumn(name="ORGNR", data_type=PostgresType.TEXT),
+]
+
+
+def feed(after, recording=None):
+    recording = recording or load_recording(RECORDING)
+    return read_changes("RAINDANCE_2610", TABLE, QUERY, KEY, after=after, columns=COLUMNS, connect_fn=replay(recording))
+
+
+def test_reads_changes_since_stored_version():
+    changes = feed(after=1030)
+    (df,) = list(changes)
+    assert not changes.full
+    assert changes.version == 1042
+    assert df["_operation"].to_list() == ["U", "I", "D"]
+    assert df["LEVID"].to_list() == [17, 2301, 88]
+    assert df["NAMN"].to_list() == ["Byggbolaget AB", "Nya Leverantören AB", None]
+
+
+def test_reads_everything_without_a_version():
+    changes = feed(after=None)
+    (df,) = list(changes)
+    assert changes.full
+    assert changes.version == 1042
+    assert "_operation" not in df.columns
+    assert df.height == 2
+
+
+def test_reads_everything_once_the_version_expired():
+    changes = feed(after=900)
+    list(changes)
+    assert changes.full
+
+
+def test_change_tracking_not_enabled():
+    recording = load_recording(RECORDING)
+    recording["CHANGE_TRACKING_CURRENT_VERSION"]["rows"] = [[None, None]]
+    with pytest.raises(ValueError, match="not enabled"):
+        list(feed(after=1030, recording=recording))
+
+
+def test_requires_columns():
+    with pytest.raises(ValueError, match="requires columns"):
+        read_changes("RAINDANCE_2610", TABLE, QUERY, KEY)
@@ -0,0 +1,76 @@
+import importlib
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from bollhav import Database, Model, WriteMode
+from bollhav.postgres import PostgresColumn, PostgresType
+from core.modes import LoadMode
+from core.read import read_changes
+from core.replay import load_recording, replay
+from core.run import CHANGE_VERSION, run
+
+# core re-exports functions named like their modules (write, read)
+state, write, maintenance = (importlib.import_module(f"core.{name}") for name in ("state", "write", "maintenance"))
+
+RECORDING = Path(__file__).parent / "fixtures" / "rk_dim_lev_changes.json"
+TABLE = "[utdata].[utdata261].[RK_DIM_LEV]"
+QUERY = f"SELECT [LEVID] AS LEVID, [NAMN] AS NAMN, [ORGNR] AS ORGNR FROM {TABLE}"
+KEY = ["LEVID"]
+COLUMNS = [
+    PostgresColumn(name="_data_modified", data_type=PostgresType.DATE),
+    PostgresColumn(name="LEVID", data_type=PostgresType.NUMERIC, nullable=False, primary_key=True),
+    PostgresColumn(name="NAMN", data_type=PostgresType.TEXT),
+    PostgresColumn(name="ORGNR", data_type=PostgresType.TEXT),
+]
+ENV = SimpleNamespace(backfill=None, cron=None)
+DEST = SimpleNamespace(hostname="localhost", database="sidewinder")
+
+
+def extract(env, cfg, after=None):
+    return read_changes("RAINDANCE_2610", TABLE, QUERY, KEY, after=after, columns=cfg.columns, connect_fn=replay(load_recording(RECORDING)))
+
+
+@pytest.fixture
+def destination(monkeypatch):
+    # Stands in for the Postgres destination: model state, the stage and the
+    # upsert that applies it
+    saved, stages, upserts = {}, [], []
+    monkeypatch.setattr(state, "load_state", lambda cfg, dsn, key: saved.get(key))
+    monkeypatch.setattr(state, "save_state", lambda cfg, dsn, key, value: saved.__setitem__(key, value))
+    monkeypatch.setattr(
+        write, "write_stage", lambda cfg, df, dsn, truncate, checkpoint=None: stages.append((truncate, df))
+    )
+    monkeypatch.setattr(write, "apply_upsert", lambda cfg, dsn, delete=True, order_by=None: upserts.append(delete))
+    monkeypatch.setattr(maintenance, "record_written", lambda cfg, dsn: None)
+    return SimpleNamespace(saved=saved, stages=stages, upserts=upserts)
+
+
+def model() -> Model:
+    return Model(
+        name="raw_ftsl.rk_dim_lev",
+        source_entity=TABLE,
+        table="rk_dim_lev",
+        schema="raw_ftsl",
+        database=Database.POSTGRES,
+        columns=COLUMNS,
+        write_mode=WriteMode.APPEND,
+    )
+
+
+def test_first_run_reads_everything_and_stores_the_version(destination):
+    run(model(), extract, ENV, DEST, load_mode=LoadMode.CHANGES)
+    assert destination.saved[CHANGE_VERSION] == "1042"
+    assert destination.upserts == [True]
+    ((truncate, df),) = destination.stages
+    assert truncate
+    assert df.height == 2
+
+
+def test_later_runs_apply_changes_to_a_fresh_stage(destination):
+    destination.saved[CHANGE_VERSION] = "1030"
+    run(model(), extract, ENV, DEST, load_mode=LoadMode.CHANGES)
+    run(model(), extract, ENV, DEST, load_mode=LoadMode.CHANGES)
+    assert destination.upserts == [False, False]
+    assert [truncate for truncate, _ in destination.stages] == [True, True]
+    assert destination.stages[-1][1]["_operation"].to_list() == ["U", "I", "D"]